@@ -0,0 +1,369 @@
+'''
+Simulates many rounds at once for scripted policies, holding the state of every round in NumPy arrays.
+'''
+import argparse
+import time
+import sys
+import os
+import numpy as np
+import eval7
+
+sys.path.append(os.getcwd())
+import engine
+from config import *
+
+FOLD, CALL, CHECK, RAISE = range(4)
+# card c has rank c // 4 and suit c % 4
+CARDS = [eval7.Card(rank + suit) for rank in '23456789TJQKA' for suit in 'cdhs']
+RANK_BITS = 1 << np.arange(13)
+
+
+def top_bits(mask, count):
+    '''
+    Returns the mask keeping only the highest count bits which are set.
+    '''
+    kept = 0
+    for bit in range(12, -1, -1):
+        if mask >> bit & 1 and count > 0:
+            kept |= 1 << bit
+            count -= 1
+    return kept
+
+
+def straight_bit(mask):
+    '''
+    Returns the bit of the highest straight's top rank in a rank mask, or 0 if there is no straight.
+    '''
+    for high in range(12, 3, -1):
+        if mask >> (high - 4) & 0b11111 == 0b11111:
+            return 1 << high
+    # the wheel plays the ace low, so it tops out at the five
+    return 1 << 3 if mask & 0b1000000001111 == 0b1000000001111 else 0
+
+
+TOP = {count: np.array([top_bits(mask, count) for mask in range(1 << 13)]) for count in (1, 2, 3, 5)}
+STRAIGHT = np.array([straight_bit(mask) for mask in range(1 << 13)])
+
+
+def evaluate(cards):
+    '''
+    Scores seven-card hands held in the last axis of an array, ordered as eval7.evaluate orders them.
+    '''
+    ranks = cards // 4
+    suits = cards % 4
+    counts = (ranks[..., None] == np.arange(13)).sum(axis=-2)
+    ranks_mask = ((counts >= 1) * RANK_BITS).sum(axis=-1)
+    pairs = ((counts >= 2) * RANK_BITS).sum(axis=-1)
+    trips = ((counts >= 3) * RANK_BITS).sum(axis=-1)
+    quads = ((counts >= 4) * RANK_BITS).sum(axis=-1)
+    suit_counts = (suits[..., None] == np.arange(4)).sum(axis=-2)
+    is_flush = suit_counts.max(axis=-1) >= 5
+    # cards of one suit have distinct ranks, so summing their bits is the same as or-ing them
+    flush_mask = np.where(suits == suit_counts.argmax(axis=-1)[..., None], 1 << ranks, 0).sum(axis=-1) * is_flush
+    straight_flush = STRAIGHT[flush_mask]
+    straight = STRAIGHT[ranks_mask]
+    quad = TOP[1][quads]
+    trip = TOP[1][trips]
+    full_house_pair = TOP[1][pairs & ~trip]
+    two_pair = TOP[2][pairs]
+    # each category's score compares its major ranks, then its kickers, as 13-bit masks
+    categories = [
+        (straight_flush > 0, 8, straight_flush, 0),
+        (quads > 0, 7, quad, TOP[1][ranks_mask & ~quad]),
+        ((trips > 0) & (full_house_pair > 0), 6, trip, full_house_pair),
+        (is_flush, 5, TOP[5][flush_mask], 0),
+        (straight > 0, 4, straight, 0),
+        (trips > 0, 3, trip, TOP[2][ranks_mask & ~trip]),
+        (two_pair != TOP[1][pairs], 2, two_pair, TOP[1][ranks_mask & ~two_pair]),
+        (pairs > 0, 1, pairs, TOP[3][ranks_mask & ~pairs]),
+    ]
+    return np.select([condition for condition, _, _, _ in categories],
+                     [category << 26 | major << 13 | kickers for _, category, major, kickers in categories],
+                     TOP[5][ranks_mask])
+
+
+class Batch():
+    '''
+    Encodes many independent rounds of poker, applying the rules of engine.RoundState to all of them at once.
+    '''
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rows = np.arange(size)
+        self.deck = rng.random((size, 52)).argsort(axis=1)
+        # the uniform draws which decide the flop and turn swaps, consumed in the order proceed_street uses them
+        self.swap_draws = rng.random((size, 2, 4))
+        self.hands = self.deck[:, :4].reshape(size, 2, 2).copy()
+        self.next_card = np.full(size, 4)
+        self.board = np.zeros((size, 5), dtype=int)
+        self.button = np.zeros(size, dtype=int)
+        self.street = np.zeros(size, dtype=int)
+        self.pips = np.tile([SMALL_BLIND, BIG_BLIND], (size, 1))
+        self.stacks = np.tile([STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND], (size, 1))
+        self.deltas = np.zeros(size, dtype=int)
+        self.done = np.zeros(size, dtype=bool)
+
+    def active(self):
+        '''
+        Returns the index of the player to act in every round.
+        '''
+        return self.button % 2
+
+    def legal_actions(self):
+        '''
+        Returns whether checking and raising are legal in every round.
+        Folding and calling are legal exactly where checking is not.
+        '''
+        active = self.active()
+        my_stack = self.stacks[self.rows, active]
+        opp_stack = self.stacks[self.rows, 1 - active]
+        continue_cost = self.pips[self.rows, 1 - active] - self.pips[self.rows, active]
+        can_check = continue_cost == 0
+        can_raise = np.where(can_check, (my_stack > 0) & (opp_stack > 0),
+                             (continue_cost != my_stack) & (opp_stack > 0))
+        return can_check, can_raise
+
+    def raise_bounds(self):
+        '''
+        Returns the minimum and maximum legal raises in every round.
+        '''
+        active = self.active()
+        my_pip = self.pips[self.rows, active]
+        continue_cost = self.pips[self.rows, 1 - active] - my_pip
+        max_contribution = np.minimum(self.stacks[self.rows, active],
+                                      self.stacks[self.rows, 1 - active] + continue_cost)
+        min_contribution = np.minimum(max_contribution, continue_cost + np.maximum(continue_cost, BIG_BLIND))
+        return my_pip + min_contribution, my_pip + max_contribution
+
+    def proceed(self, actions, amounts):
+        '''
+        Advances every unfinished round by one action of its active player.
+        Illegal actions become a check, or a fold when checking is illegal, as in engine.Player.query.
+        '''
+        live = ~self.done
+        active = self.active()
+        rows = self.rows
+        can_check, can_raise = self.legal_actions()
+        min_raise, max_raise = self.raise_bounds()
+        legal = np.select([actions == CHECK, actions == RAISE], [can_check, can_raise & (min_raise <= amounts) &
+                                                                 (amounts <= max_raise)], ~can_check)
+        actions = np.where(legal, actions, np.where(can_check, CHECK, FOLD))
+        continue_cost = self.pips[rows, 1 - active] - self.pips[rows, active]
+        fold = live & (actions == FOLD)
+        blind_call = live & (actions == CALL) & (self.button == 0)
+        call = live & (actions == CALL) & (self.button != 0)
+        check = live & (actions == CHECK)
+        check_closes = check & (((self.street == 0) & (self.button > 0)) | (self.button > 1))
+        raise_ = live & (actions == RAISE)
+        fold_deltas = np.where(active == 0, self.stacks[:, 0] - STARTING_STACK, STARTING_STACK - self.stacks[:, 1])
+        self.deltas[fold] = fold_deltas[fold]
+        self.done |= fold
+        # the small blind completing the big blind leaves the big blind to act
+        self.pips[blind_call] = BIG_BLIND
+        self.stacks[blind_call] = STARTING_STACK - BIG_BLIND
+        contribution = np.where(raise_, amounts - self.pips[rows, active], continue_cost)
+        paying = call | raise_
+        self.stacks[rows[paying], active[paying]] -= contribution[paying]
+        self.pips[rows[paying], active[paying]] += contribution[paying]
+        self.button[blind_call | raise_ | (check & ~check_closes)] += 1
+        self.proceed_street(call | check_closes)
+
+    def deal(self, rounds, slot):
+        '''
+        Deals the next card of the chosen rounds into one board slot.
+        '''
+        self.board[rounds, slot] = self.deck[rounds, self.next_card[rounds]]
+        self.next_card[rounds] += 1
+
+    def proceed_street(self, closed):
+        '''
+        Resets the pips and deals the next street in every round whose betting closed, or shows the river down.
+        '''
+        self.showdown(closed & (self.street == 5))
+        closed &= self.street < 5
+        for street, percent, draw_index in ((0, FLOP_PERCENT, 0), (3, TURN_PERCENT, 1)):
+            swapping = closed & (self.street == street)
+            for i in range(4):
+                # a swapped out card goes to the bottom of the deck, where it is never dealt
+                swapped = self.rows[swapping & (self.swap_draws[:, draw_index, i] < percent)]
+                self.hands[swapped, i // 2, i % 2] = self.deck[swapped, self.next_card[swapped]]
+                self.next_card[swapped] += 1
+        flop = self.rows[closed & (self.street == 0)]
+        for slot in range(3):
+            self.deal(flop, slot)
+        later = self.rows[closed & (self.street > 0)]
+        self.deal(later, self.street[later])
+        self.street[closed] = np.where(self.street == 0, 3, self.street + 1)[closed]
+        self.button[closed] = 1
+        self.pips[closed] = 0
+
+    def showdown(self, rounds):
+        '''
+        Compares the players' hands and computes payoffs in the chosen rounds.
+        '''
+        board = self.board[rounds]
+        score0 = evaluate(np.concatenate([board, self.hands[rounds, 0]], axis=1))
+        score1 = evaluate(np.concatenate([board, self.hands[rounds, 1]], axis=1))
+        stacks = self.stacks[rounds]
+        self.deltas[rounds] = np.select([score0 > score1, score0 < score1],
+                                        [STARTING_STACK - stacks[:, 1], stacks[:, 0] - STARTING_STACK],
+                                        (stacks[:, 0] - stacks[:, 1]) // 2)
+        self.done |= rounds
+
+
+def check_call(batch):
+    '''
+    Checks when it can and calls otherwise, like the check_call pokerbot.
+    '''
+    can_check, _ = batch.legal_actions()
+    return np.where(can_check, CHECK, CALL), np.zeros(batch.size, dtype=int)
+
+
+def raise_by_4(batch):
+    '''
+    Raises to 4 while it has put in less than 4 and could put in more, otherwise checks or calls,
+    like the raise_by_4 pokerbot.
+    '''
+    can_check, can_raise = batch.legal_actions()
+    my_pip = batch.pips[batch.rows, batch.active()]
+    _, max_raise = batch.raise_bounds()
+    raising = can_raise & (my_pip < 4) & (max_raise - my_pip > 4)
+    return np.where(raising, RAISE, np.where(can_check, CHECK, CALL)), np.full(batch.size, 4)
+
+
+def check_call_reference(round_state, active):
+    '''
+    The check_call pokerbot's decision on an engine.RoundState.
+    '''
+    return engine.CheckAction() if engine.CheckAction in round_state.legal_actions() else engine.CallAction()
+
+
+def raise_by_4_reference(round_state, active):
+    '''
+    The raise_by_4 pokerbot's decision on an engine.RoundState.
+    '''
+    if engine.RaiseAction in round_state.legal_actions():
+        _, max_raise = round_state.raise_bounds()
+        if round_state.pips[active] < 4 and max_raise - round_state.pips[active] > 4:
+            return engine.RaiseAction(4)
+    return check_call_reference(round_state, active)
+
+
+POLICIES = {'check_call': (check_call, check_call_reference), 'raise_by_4': (raise_by_4, raise_by_4_reference)}
+
+
+def play(batch, policies):
+    '''
+    Plays every round of the batch to the end, with policies[0] seated first in even rounds and second in odd rounds.
+    '''
+    # the players swap seats every round, as in engine.Game
+    first_seat = batch.rows % 2
+    while not batch.done.all():
+        first_actions, first_amounts = policies[0](batch)
+        second_actions, second_amounts = policies[1](batch)
+        first_to_act = batch.active() == first_seat
+        batch.proceed(np.where(first_to_act, first_actions, second_actions),
+                      np.where(first_to_act, first_amounts, second_amounts))
+    return np.where(first_seat == 0, batch.deltas, -batch.deltas)
+
+
+class ReplayRandom():
+    '''
+    Stands in for a round's random generator, replaying the swap draws of one round of a batch.
+    '''
+
+    def __init__(self, draws):
+        self.draws = iter(draws.tolist())
+
+    def random(self):
+        '''
+        Returns the next draw.
+        '''
+        return next(self.draws)
+
+
+def replay(batch, index, references):
+    '''
+    Plays one round of a batch through engine.RoundState and returns the first seat's delta.
+    '''
+    cards = [CARDS[card] for card in batch.deck[index]]
+    hands = [cards[0:2], cards[2:4]]
+    pips = (SMALL_BLIND, BIG_BLIND)
+    stacks = (STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND)
+    rng = ReplayRandom(batch.swap_draws[index].ravel())
+    round_state = engine.RoundState(0, 0, pips, stacks, hands, ([], cards, rng, 4), None)
+    seats = references if index % 2 == 0 else references[::-1]
+    while not isinstance(round_state, engine.TerminalState):
+        active = round_state.button % 2
+        action = seats[active](round_state, active)
+        legal_actions = round_state.legal_actions()
+        if isinstance(action, engine.RaiseAction):
+            min_raise, max_raise = round_state.raise_bounds()
+            legal = engine.RaiseAction in legal_actions and min_raise <= action.amount <= max_raise
+        else:
+            legal = type(action) in legal_actions
+        if not legal:
+            action = engine.CheckAction() if engine.CheckAction in legal_actions else engine.FoldAction()
+        round_state = round_state.proceed(action)
+    return round_state.deltas[0]
+
+
+def validate(names, rounds, rng):
+    '''
+    Checks the evaluator against eval7 and every round of a batch against engine.RoundState.
+    Returns the number of mismatches.
+    '''
+    hands = np.array([rng.permutation(52)[:9] for _ in range(rounds)])
+    scores = evaluate(np.concatenate([hands[:, :5], hands[:, 5:7]], axis=1)), evaluate(hands[:, [0, 1, 2, 3, 4, 7, 8]])
+    mismatches = 0
+    for index in range(rounds):
+        reference = [eval7.evaluate([CARDS[card] for card in hands[index, seven]])
+                     for seven in ([0, 1, 2, 3, 4, 5, 6], [0, 1, 2, 3, 4, 7, 8])]
+        if np.sign(scores[0][index] - scores[1][index]) != np.sign(reference[0] - reference[1]):
+            mismatches += 1
+    batch = Batch(rounds, rng)
+    deltas = play(batch, [POLICIES[name][0] for name in names])
+    references = [POLICIES[name][1] for name in names]
+    for index in range(rounds):
+        expected = replay(batch, index, references)
+        if (expected if index % 2 == 0 else -expected) != deltas[index]:
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    '''
+    Simulates a match between two scripted policies.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 batch_engine.py')
+    parser.add_argument('players', type=str, nargs=2, choices=list(POLICIES), help='The two policies to simulate')
+    parser.add_argument('--rounds', type=int, default=1000000, help='Rounds to simulate, defaults to 1000000')
+    parser.add_argument('--batch', type=int, default=100000, help='Rounds held in memory at once, defaults to 100000')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the simulation, defaults to random')
+    parser.add_argument('--validate', type=int, default=0,
+                        help='Rounds to replay through engine.RoundState before simulating, defaults to 0')
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    if args.validate > 0:
+        mismatches = validate(args.players, args.validate, rng)
+        print('Validated {} rounds against engine.RoundState: {} mismatches'.format(args.validate, mismatches))
+        if mismatches > 0:
+            sys.exit(1)
+    policies = [POLICIES[name][0] for name in args.players]
+    total, sum_squares, played = 0, 0, 0
+    start_time = time.perf_counter()
+    while played < args.rounds:
+        deltas = play(Batch(min(args.batch, args.rounds - played), rng), policies)
+        total += int(deltas.sum())
+        sum_squares += int((deltas ** 2).sum())
+        played += len(deltas)
+    elapsed = time.perf_counter() - start_time
+    mean = total / played
+    stdev = np.sqrt(max(sum_squares / played - mean ** 2, 0.) * played / max(played - 1, 1))
+    print('{} rounds in {:.2f}s, {:.0f} rounds per second'.format(played, elapsed, played / elapsed))
+    print('{} vs {}: {:.4f} chips per round, stdev {:.2f}, standard error {:.4f}'.format(
+        args.players[0], args.players[1], mean, stdev, stdev / np.sqrt(played)))
+
+
+if __name__ == '__main__':
+    main()
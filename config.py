@@ -7,13 +7,69 @@ PLAYER_2_NAME = 'B'
 PLAYER_2_PATH = './precompute_with_preflop_fold'
 # GAME PROGRESS IS RECORDED HERE
 GAME_LOG_FILENAME = 'gamelog'
+# ONE JSON RECORD PER ROUND IS ALSO WRITTEN TO GAME_LOG_FILENAME.jsonl
+STRUCTURED_LOG = False
 # PLAYER_LOG_SIZE_LIMIT IS IN BYTES
 PLAYER_LOG_SIZE_LIMIT = 524288
+# KEEP THE 'head', THE 'tail' OR 'both' HALVES OF A PLAYER'S OUTPUT WHEN IT EXCEEDS THE LIMIT
+PLAYER_LOG_KEEP = 'head'
+# STREAMING WRITES THE KEPT HEAD TO DISK AS IT ARRIVES
+PLAYER_LOG_STREAM = False
+# LATENCY PERCENTILES BY STREET AND ACTION, AND THE ENGINE'S OWN TIME, ARE REPORTED AT THE END OF THE MATCH
+LATENCY_REPORT = False
 # STARTING_GAME_CLOCK AND TIMEOUTS ARE IN SECONDS
 ENFORCE_GAME_CLOCK = False
 STARTING_GAME_CLOCK = 30.
+# THE 'wall' GAME CLOCK CHARGES ALL THE TIME SPENT WAITING FOR A BOT, THE 'cpu' CLOCK LEAVES OUT THE TIME THE BOT
+# SPENT WAITING FOR A CPU, SO BUSY HOSTS DO NOT TIME BOTS OUT; TIME IT SPENT SLEEPING OR BLOCKED IS STILL CHARGED,
+# LESS AT MOST CPU_CLOCK_ALLOWANCE PER RESPONSE FOR MESSAGES IN TRANSIT
+GAME_CLOCK_MODE = 'wall'
+CPU_CLOCK_ALLOWANCE = 0.05
 BUILD_TIMEOUT = 10.
+# BUILDS ARE SKIPPED WHEN THE BOT'S FILES AND BUILD COMMAND ARE UNCHANGED SINCE ITS LAST SUCCESSFUL BUILD
+BUILD_CACHE = True
 CONNECT_TIMEOUT = 100000.
+# BOTS WHICH LIST THIS TRANSPORT IN commands.json USE IT: 'tcp', 'unix', 'socketpair' OR 'shm'
+TRANSPORT = 'tcp'
+# WITH MORE THAN ONE TABLE, POKERBOTS WHICH ACCEPT TABLES PLAY NUM_TABLES GAMES AT ONCE OVER ONE CONNECTION
+# EACH TABLE PLAYS NUM_ROUNDS ROUNDS AND WRITES ITS OWN GAME LOG, AND ONE GAME CLOCK NUM_TABLES TIMES AS LONG
+# COVERS ALL OF A POKERBOT'S TABLES
+NUM_TABLES = 1
+# TOURNAMENTS KEEP POKERBOTS WHICH ACCEPT MATCHES RUNNING FROM ONE MATCH TO THE NEXT INSTEAD OF RESTARTING THEM
+# A SINGLE MATCH RUN WITH engine.py STILL STOPS THEM WHEN IT ENDS
+REUSE_PLAYERS = False
+# SKIPPING ACKS SENDS EACH ROUND'S RESULT WITH THE PLAYER'S NEXT MESSAGE INSTEAD OF WAITING FOR A K
+SKIP_ROUND_ACKS = False
+# CHECKS FORCED BY AN ALL-IN ARE PLAYED BY THE ENGINE WITHOUT QUERYING THE BOT
+AUTO_ADVANCE = True
+# TELEMETRY SAMPLES EACH BOT PROCESS'S MEMORY, CPU TIME AND THREADS AFTER EVERY RESPONSE AND EVERY
+# TELEMETRY_INTERVAL SECONDS, AND REPORTS THEM AT THE END OF THE MATCH
+TELEMETRY = False
+TELEMETRY_INTERVAL = 1.
+# PYTHON BOTS ARE FORKED FROM A PROCESS WHICH HAS ALREADY IMPORTED AND CONSTRUCTED THEM, ONE PER BOT DIRECTORY,
+# WHICH EXITS ONCE NO FORKED BOT HAS RUN FOR FORK_SERVER_IDLE_TIMEOUT SECONDS
+FORK_SERVER = False
+FORK_SERVER_IDLE_TIMEOUT = 600.
+# PYTHON BOTS CAN BE RUN INSIDE THE ENGINE PROCESS INSTEAD OF OVER A SOCKET
+IN_PROCESS = False
+# EVERY ROUND'S SHUFFLE AND SWAPS ARE DERIVED FROM SEED AND THE ROUND NUMBER
+# NONE PICKS A FRESH SEED FOR EVERY MATCH
+SEED = None
+# DUPLICATE MODE PLAYS EVERY DEAL ONCE, THEN REPLAYS THEM ALL WITH THE SEATS REVERSED AND REPORTS THE PAIRED
+# DIFFERENCE, RESETTING BOTS WHICH ACCEPT MATCHES BEFORE THE REPLAY SO THAT THEY DO NOT REMEMBER THE DEALS
+DUPLICATE = False
+# ALL-IN EQUITY REPORTS BANKROLLS WITH EVERY ALL-IN BEFORE THE RIVER PAID AT ITS EXPECTED VALUE
+# EXPECTATIONS ARE EXACT WHEN NO SWAP CAN FOLLOW AND AT MOST EQUITY_SAMPLES RUNOUTS REMAIN, AS ON THE TURN,
+# OTHERWISE THEY AVERAGE EQUITY_SAMPLES RANDOM SWAPS AND RUNOUTS
+ALL_IN_EQUITY = False
+EQUITY_SAMPLES = 1000
+# SPRT ENDS A MATCH EARLY ONCE A SEQUENTIAL TEST DECIDES WHETHER A PLAYER WINS AT LEAST SPRT_DELTA CHIPS PER ROUND
+# SPRT_ALPHA AND SPRT_BETA ARE THE FALSE POSITIVE AND FALSE NEGATIVE RATES, NUM_ROUNDS STILL CAPS THE MATCH
+SPRT = False
+SPRT_ALPHA = 0.05
+SPRT_BETA = 0.05
+SPRT_DELTA = 2.
+SPRT_MIN_ROUNDS = 100
 # THE GAME VARIANT FIXES THE PARAMETERS BELOW
 # CHANGE ONLY FOR TRAINING OR EXPERIMENTATION
 FLOP_PERCENT = 0.1
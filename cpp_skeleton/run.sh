@@ -1,3 +1,3 @@
 #!/bin/bash
 
-./build/pokerbot "$@"
+exec ./build/pokerbot "$@"
@@ -2,17 +2,30 @@
 6.176 MIT POKERBOTS GAME ENGINE
 DO NOT REMOVE, RENAME, OR EDIT THIS FILE
 '''
-from collections import namedtuple
-from threading import Thread
-from queue import Queue
+from collections import namedtuple, deque
+from contextlib import redirect_stdout, contextmanager
+from multiprocessing import shared_memory
+from queue import Queue, Empty
+from threading import Thread, Lock, Event
+import importlib.util
+import itertools
+import selectors
+import traceback
+import hashlib
+import tempfile
+import shutil
 import time
 import json
 import subprocess
 import socket
+import signal
+import struct
 import eval7
 import sys
 import os
+import math
 import random
+import fcntl
 
 sys.path.append(os.getcwd())
 from config import *
@@ -23,13 +36,20 @@ CheckAction = namedtuple('CheckAction', [])
 # we coalesce BetAction and RaiseAction for convenience
 RaiseAction = namedtuple('RaiseAction', ['amount'])
 TerminalState = namedtuple('TerminalState', ['deltas', 'previous_state'])
+# legal action sets are shared by every state, so they must never be modified
+CHECK_ONLY = frozenset([CheckAction])
+CHECK_OR_RAISE = frozenset([CheckAction, RaiseAction])
+FOLD_OR_CALL = frozenset([FoldAction, CallAction])
+FOLD_CALL_OR_RAISE = frozenset([FoldAction, CallAction, RaiseAction])
 
 STREET_NAMES = ['Flop', 'Turn', 'River']
 DECODE = {'F': FoldAction, 'C': CallAction, 'K': CheckAction, 'R': RaiseAction}
+ENCODE = {action: code for code, action in DECODE.items()}
 CCARDS = lambda cards: ','.join(map(str, cards))
 PCARDS = lambda cards: '[{}]'.format(' '.join(map(str, cards)))
 PVALUE = lambda name, value: ', {} ({})'.format(name, value)
 STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
+ADJUSTED_STATUS = lambda players: ''.join([PVALUE(p.name, round(p.adjusted_bankroll, 2)) for p in players])
 
 # Socket encoding scheme:
 #
@@ -45,43 +65,145 @@ STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
 # O**,** the opponent's hand in common format
 # D### the player's bankroll delta from the round
 # Q game over
+# N another match against the same engine follows, sent at the end of a match instead of Q,
+#   or before duplicate mode replays its deals
 #
 # Clauses are separated by spaces
 # Messages end with '\n'
 # The engine expects a response of K at the end of the round as an ack,
 # otherwise a response which encodes the player's action
 # Action history is sent once, including the player's actions
+#
+# V*,* the protocol features offered by the engine, sent alone right after connecting
+#
+# Pokerbots answer the offer with V followed by the features they accept,
+# skeletons which predate the offer ignore it and ack with K
+#
+# I# the table which the following clauses belong to, once tables are accepted
+#
+# With tables, every message starts with the table it belongs to and so does every response,
+# one pokerbot plays NUM_TABLES games at once and the last message carries every table before Q
+#
+# With matches, a pokerbot which receives N resets its game state, acks with K once everything it printed
+# has been flushed, and waits for the first round of the next match
+
+
+def offered_features():
+    '''
+    Returns the protocol features enabled in config.py.
+    '''
+    features = []
+    if NUM_TABLES > 1:
+        features.append('tables')
+    if REUSE_PLAYERS or DUPLICATE:
+        features.append('matches')
+    return features
+
+
+def round_rng(seed, round_num):
+    '''
+    Derives the random generator for one round's shuffle and swaps from the master seed.
+    '''
+    return random.Random('{}:{}'.format(seed, round_num))
+
+
+# eval7 cards are immutable, so every round shuffles its own copy of one list of them
+DECK_CARDS = eval7.Deck().cards
+
+
+def deal_round(seed, round_num):
+    '''
+    Deals one round from the master seed, independently of every other round.
+    The deck tuple holds the board, the shuffled cards, the generator for the swaps and the index of the next card.
+    '''
+    rng = round_rng(seed, round_num)
+    cards = list(DECK_CARDS)
+    rng.shuffle(cards)
+    hands = [cards[0:2], cards[2:4]]
+    pips = (SMALL_BLIND, BIG_BLIND)
+    stacks = (STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND)
+    return RoundState(0, 0, pips, stacks, hands, ([], cards, rng, 4), None)
+
+
+def showdown_delta(board, hands, stacks):
+    '''
+    Returns the first player's payoff when the players show down their hands.
+    '''
+    score0 = eval7.evaluate(board + hands[0])
+    score1 = eval7.evaluate(board + hands[1])
+    if score0 > score1:
+        return STARTING_STACK - stacks[1]
+    if score0 < score1:
+        return stacks[0] - STARTING_STACK
+    return (stacks[0] - stacks[1]) // 2  # split the pot
+
+
+def draw(cards, rng):
+    '''
+    Removes and returns a random card from the list.
+    '''
+    index = rng.randrange(len(cards))
+    cards[index], cards[-1] = cards[-1], cards[index]
+    return cards.pop()
 
 
-def swap(player_card_index, hands, deck):
+def all_in_deltas(round_state, stacks, rng):
     '''
-    Swaps player's card with a card from the deck.
+    Returns the expected payoffs of an all-in which closed the betting on round_state's street.
+    When no swap can follow and there are at most EQUITY_SAMPLES runouts, every runout is enumerated exactly,
+    otherwise EQUITY_SAMPLES random swaps and runouts are averaged.
     '''
-    card_index = player_card_index % len(hands)
-    player_index = player_card_index // len(hands)
-    random_card = deck.deal(1)
-    deck.cards.append(hands[player_index][card_index])
-    hands[player_index][card_index] = random_card[0]
-    return hands, deck
+    board, cards, _, next_card = round_state.deck
+    undealt = cards[next_card:]
+    # swaps happen as the flop and the turn are dealt
+    swaps = ((round_state.street == 0 and (FLOP_PERCENT > 0 or TURN_PERCENT > 0)) or
+             (round_state.street == 3 and TURN_PERCENT > 0))
+    remaining = 5 - len(board)
+    runouts = math.comb(len(undealt), remaining)
+    if not swaps and runouts <= EQUITY_SAMPLES:
+        delta = sum(showdown_delta(board + list(runout), round_state.hands, stacks)
+                    for runout in itertools.combinations(undealt, remaining)) / runouts
+        return [delta, -delta]
+    total = 0
+    for _ in range(EQUITY_SAMPLES):
+        cards = list(undealt)
+        hands = [list(hand) for hand in round_state.hands]
+        runout = list(board)
+        street = round_state.street
+        # the cards swapped out go to the bottom of the deck and are never dealt, so every draw is uniform
+        while street < 5:
+            if street == 0 or street == 3:
+                for i in range(4):
+                    if rng.random() < (FLOP_PERCENT if street == 0 else TURN_PERCENT):
+                        hands[i // 2][i % 2] = draw(cards, rng)
+            runout += [draw(cards, rng) for _ in range(3 if street == 0 else 1)]
+            street = 3 if street == 0 else street + 1
+        total += showdown_delta(runout, hands, stacks)
+    delta = total / EQUITY_SAMPLES
+    return [delta, -delta]
 
 
-class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks', 'hands', 'deck', 'previous_state'])):
+class RoundState():
     '''
     Encodes the game tree for one round of poker.
+    Pips and stacks are tuples, and states share the lists in hands and the deck, so none of them are modified.
     '''
+    __slots__ = ['button', 'street', 'pips', 'stacks', 'hands', 'deck', 'previous_state']
+
+    def __init__(self, button, street, pips, stacks, hands, deck, previous_state):
+        self.button = button
+        self.street = street
+        self.pips = pips
+        self.stacks = stacks
+        self.hands = hands
+        self.deck = deck
+        self.previous_state = previous_state
 
     def showdown(self):
         '''
         Compares the players' hands and computes payoffs.
         '''
-        score0 = eval7.evaluate(self.deck[0] + self.hands[0])
-        score1 = eval7.evaluate(self.deck[0] + self.hands[1])
-        if score0 > score1:
-            delta = STARTING_STACK - self.stacks[1]
-        elif score0 < score1:
-            delta = self.stacks[0] - STARTING_STACK
-        else:  # split the pot
-            delta = (self.stacks[0] - self.stacks[1]) // 2
+        delta = showdown_delta(self.deck[0], self.hands, self.stacks)
         return TerminalState([delta, -delta], self)
 
     def legal_actions(self):
@@ -93,11 +215,11 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
         if continue_cost == 0:
             # we can only raise the stakes if both players can afford it
             bets_forbidden = (self.stacks[0] == 0 or self.stacks[1] == 0)
-            return {CheckAction} if bets_forbidden else {CheckAction, RaiseAction}
+            return CHECK_ONLY if bets_forbidden else CHECK_OR_RAISE
         # continue_cost > 0
         # similarly, re-raising is only allowed if both players can afford it
         raises_forbidden = (continue_cost == self.stacks[active] or self.stacks[1-active] == 0)
-        return {FoldAction, CallAction} if raises_forbidden else {FoldAction, CallAction, RaiseAction}
+        return FOLD_OR_CALL if raises_forbidden else FOLD_CALL_OR_RAISE
 
     def raise_bounds(self):
         '''
@@ -116,15 +238,20 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
         if self.street == 5:
             return self.showdown()
         new_street = 3 if self.street == 0 else self.street + 1
-        new_hands = self.hands.copy()
-        new_deck = eval7.Deck()
-        new_deck.cards = self.deck[1].cards.copy()
+        board, cards, rng, next_card = self.deck
+        new_hands = self.hands
         if self.street == 0 or self.street == 3:
-            for i in range(sum([len(hand) for hand in self.hands])):
-                if random.random() < (FLOP_PERCENT if self.street == 0 else TURN_PERCENT):
-                    new_hands, new_deck = swap(i, new_hands, new_deck)
-        board = self.deck[0] + new_deck.deal(3 if self.street == 0 else 1)
-        return RoundState(1, new_street, [0, 0], self.stacks, new_hands, (board, new_deck), self)
+            # swaps replace cards in place, so copy each hand to leave this street's hands intact
+            new_hands = [list(hand) for hand in self.hands]
+            percent = FLOP_PERCENT if self.street == 0 else TURN_PERCENT
+            for i in range(4):
+                if rng.random() < percent:
+                    # the card swapped out would go to the bottom of the deck, which is never reached
+                    new_hands[i // 2][i % 2] = cards[next_card]
+                    next_card += 1
+        dealt = 3 if self.street == 0 else 1
+        new_deck = (board + cards[next_card:next_card + dealt], cards, rng, next_card + dealt)
+        return RoundState(1, new_street, (0, 0), self.stacks, new_hands, new_deck, self)
 
     def proceed(self, action):
         '''
@@ -136,13 +263,15 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
             return TerminalState([delta, -delta], self)
         if isinstance(action, CallAction):
             if self.button == 0:  # sb calls bb
-                return RoundState(1, 0, [BIG_BLIND] * 2, [STARTING_STACK - BIG_BLIND] * 2, self.hands, self.deck, self)
+                stacks = (STARTING_STACK - BIG_BLIND, STARTING_STACK - BIG_BLIND)
+                return RoundState(1, 0, (BIG_BLIND, BIG_BLIND), stacks, self.hands, self.deck, self)
             # both players acted
-            new_pips = list(self.pips)
-            new_stacks = list(self.stacks)
-            contribution = new_pips[1-active] - new_pips[active]
-            new_stacks[active] -= contribution
-            new_pips[active] += contribution
+            contribution = self.pips[1-active] - self.pips[active]
+            if active == 0:
+                new_stacks = (self.stacks[0] - contribution, self.stacks[1])
+            else:
+                new_stacks = (self.stacks[0], self.stacks[1] - contribution)
+            new_pips = (self.pips[1-active], self.pips[1-active])
             state = RoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self)
             return state.proceed_street()
         if isinstance(action, CheckAction):
@@ -151,109 +280,1195 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
             # let opponent act
             return RoundState(self.button + 1, self.street, self.pips, self.stacks, self.hands, self.deck, self)
         # isinstance(action, RaiseAction)
-        new_pips = list(self.pips)
-        new_stacks = list(self.stacks)
-        contribution = action.amount - new_pips[active]
-        new_stacks[active] -= contribution
-        new_pips[active] += contribution
+        contribution = action.amount - self.pips[active]
+        if active == 0:
+            new_pips = (action.amount, self.pips[1])
+            new_stacks = (self.stacks[0] - contribution, self.stacks[1])
+        else:
+            new_pips = (self.pips[0], action.amount)
+            new_stacks = (self.stacks[0], self.stacks[1] - contribution)
         return RoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self)
 
 
-class Player():
-    '''
-    Handles subprocess and socket interactions with one player's pokerbot.
-    '''
+class OutputCapture():
+    '''
+    Captures a pokerbot's output in memory bounded by PLAYER_LOG_SIZE_LIMIT, keeping its head and/or tail.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.head_limit = {'head': PLAYER_LOG_SIZE_LIMIT, 'tail': 0}.get(PLAYER_LOG_KEEP, PLAYER_LOG_SIZE_LIMIT // 2)
+        self.tail_limit = PLAYER_LOG_SIZE_LIMIT - self.head_limit
+        self.head_size = 0
+        self.head = []
+        self.tail = deque()
+        self.tail_size = 0
+        self.dropped = 0
+        self.saved = False
+        self.lock = Lock()
+        # streaming writes the head straight to disk as it arrives
+        self.log_file = open(name, 'wb') if PLAYER_LOG_STREAM else None
+
+    def put(self, output):
+        '''
+        Captures one chunk of output bytes.
+        '''
+        if output is None:
+            return
+        with self.lock:
+            if self.head_size < self.head_limit:
+                kept = output[:self.head_limit - self.head_size]
+                self.head_size += len(kept)
+                if self.log_file is not None:
+                    self.log_file.write(kept)
+                else:
+                    self.head.append(kept)
+                output = output[len(kept):]
+            if len(output) > self.tail_limit:
+                self.dropped += len(output) - self.tail_limit
+                output = output[len(output) - self.tail_limit:]
+            if output:
+                self.tail.append(output)
+                self.tail_size += len(output)
+            while self.tail_size > self.tail_limit:
+                excess = self.tail_size - self.tail_limit
+                if len(self.tail[0]) <= excess:
+                    self.tail_size -= len(self.tail[0])
+                    self.dropped += len(self.tail.popleft())
+                else:
+                    self.tail[0] = self.tail[0][excess:]
+                    self.tail_size -= excess
+                    self.dropped += excess
+
+    def write(self, text):
+        '''
+        Captures printed text, so that the capture can stand in for sys.stdout.
+        '''
+        self.put(text.encode())
+        return len(text)
+
+    def flush(self):
+        '''
+        Nothing is buffered outside the capture.
+        '''
+
+    def save(self):
+        '''
+        Writes the captured output to the player log once, noting how many bytes were dropped.
+        '''
+        with self.lock:
+            if self.saved:
+                return
+            self.saved = True
+            log_file = self.log_file if self.log_file is not None else open(self.name, 'wb')
+            with log_file:
+                for output in self.head:
+                    log_file.write(output)
+                if self.dropped > 0:
+                    separator = '\n' if self.head_size > 0 else ''
+                    log_file.write('{}[{} bytes dropped]\n'.format(separator, self.dropped).encode())
+                for output in self.tail:
+                    log_file.write(output)
+            self.log_file = None
+
+
+class OutputPump():
+    '''
+    Copies the output of every pokerbot in the process into its capture from a single thread.
+    '''
+    CHUNK_SIZE = 65536
+
+    def __init__(self):
+        self.selector = None
+        self.wake_read = self.wake_write = None
+        self.lock = Lock()
+        self.changes = []
+
+    def start(self):
+        '''
+        Creates the selector and its thread, which dies with the program, on first use.
+        '''
+        self.selector = selectors.DefaultSelector()
+        self.wake_read, self.wake_write = os.pipe()
+        self.selector.register(self.wake_read, selectors.EVENT_READ)
+        Thread(target=self.pump, daemon=True).start()
+
+    def change(self, function):
+        '''
+        Runs a change to the selected pipes on the pump's thread, waking it from select.
+        '''
+        with self.lock:
+            if self.selector is None:
+                self.start()
+            self.changes.append(function)
+        os.write(self.wake_write, b'\0')
+
+    def add(self, pipe, capture):
+        '''
+        Starts copying a pipe into a capture, returning an Event which is set once the pipe is closed.
+        '''
+        closed = Event()
+        def register():
+            # a redirect may drain a pipe which select reported ready, so reads must not block
+            os.set_blocking(pipe.fileno(), False)
+            self.selector.register(pipe, selectors.EVENT_READ, (capture, closed))
+        self.change(register)
+        return closed
+
+    def redirect(self, pipe, capture):
+        '''
+        Copies everything already in a pipe into its current capture, then sends later output to another one.
+        Returns an Event which is set once the pipe's earlier output has been captured.
+        '''
+        redirected = Event()
+        def swap():
+            if not pipe.closed:
+                earlier_capture, closed = self.selector.get_key(pipe).data
+                while True:
+                    try:
+                        output = os.read(pipe.fileno(), self.CHUNK_SIZE)
+                    except BlockingIOError:
+                        break
+                    if not output:
+                        break
+                    earlier_capture.put(output)
+                self.selector.modify(pipe, selectors.EVENT_READ, (capture, closed))
+            redirected.set()
+        self.change(swap)
+        return redirected
+
+    def remove(self, pipe, closed):
+        '''
+        Closes a pipe whether or not its writers have closed it.
+        '''
+        def close():
+            if not pipe.closed:
+                self.selector.unregister(pipe)
+                pipe.close()
+            closed.set()
+        self.change(close)
+
+    def pump(self):
+        '''
+        Captures output from whichever pipes are ready, until the program exits.
+        '''
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    os.read(self.wake_read, self.CHUNK_SIZE)
+                    with self.lock:
+                        changes, self.changes = self.changes, []
+                    for function in changes:
+                        function()
+                    continue
+                capture, closed = key.data
+                # an earlier change in this batch may have closed the pipe
+                if key.fileobj.closed:
+                    continue
+                try:
+                    output = os.read(key.fd, self.CHUNK_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    output = b''
+                if output:
+                    capture.put(output)
+                else:
+                    self.selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    closed.set()
+
+
+OUTPUT_PUMP = OutputPump()
+
+
+class ProcessTree():
+    '''
+    A pokerbot's process and every process it started, as run scripts which do not exec the pokerbot
+    leave a shell as the process the engine started.
+    '''
+    # /proc/<pid>/task/<tid>/children is missing from kernels built without CONFIG_PROC_CHILDREN
+    CHILDREN_LISTED = os.path.exists('/proc/self/task/{}/children'.format(os.getpid()))
+    REFRESH_INTERVAL = 1.
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.lock = Lock()
+        self.pids = [pid]
+        self.refreshed = None
+        # tasks which exited keep the times they were last seen with, so the totals never go back
+        self.task_times = {}
+
+    def members(self):
+        '''
+        Returns the pids in the tree, which are looked up again at most every REFRESH_INTERVAL seconds.
+        '''
+        with self.lock:
+            now = time.perf_counter()
+            if self.refreshed is None or now - self.refreshed >= self.REFRESH_INTERVAL:
+                self.pids = self.find()
+                self.refreshed = now
+            return self.pids
+
+    def find(self):
+        '''
+        Walks the tree down from its root, whose descendants are listed by the kernel or found by their parents.
+        '''
+        children = None if self.CHILDREN_LISTED else self.children_by_parent()
+        pids = [self.pid]
+        # the list grows while it is walked, so every descendant is visited
+        for pid in pids:
+            pids.extend(self.listed_children(pid) if children is None else children.get(pid, ()))
+        return pids
+
+    @staticmethod
+    def listed_children(pid):
+        '''
+        Returns the children the kernel lists for every thread of a process.
+        '''
+        task_directory = '/proc/{}/task'.format(pid)
+        children = []
+        try:
+            for task in os.listdir(task_directory):
+                with open(os.path.join(task_directory, task, 'children'), 'rb') as children_file:
+                    children.extend(int(child) for child in children_file.read().split())
+        except (OSError, ValueError):
+            pass
+        return children
+
+    @staticmethod
+    def children_by_parent():
+        '''
+        Maps every running process's parent to its children.
+        '''
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open('/proc/{}/stat'.format(entry), 'rb') as stat:
+                    # the command name may contain spaces, so fields are counted from its closing parenthesis
+                    parent = int(stat.read().rpartition(b')')[2].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+        return children
+
+    def schedstat(self):
+        '''
+        Returns the seconds every thread in the tree has so far spent on a CPU and waiting for one,
+        or None when /proc cannot tell.
+        '''
+        pids = self.members()
+        with self.lock:
+            for pid in pids:
+                task_directory = '/proc/{}/task'.format(pid)
+                try:
+                    tasks = os.listdir(task_directory)
+                except OSError:
+                    continue
+                for task in tasks:
+                    try:
+                        self.task_times[task] = read_schedstat(os.path.join(task_directory, task, 'schedstat'))
+                    except (OSError, ValueError, IndexError):
+                        continue
+            if not self.task_times:
+                return None
+            return tuple(sum(times) for times in zip(*self.task_times.values()))
+
+
+def read_schedstat(path):
+    '''
+    Returns the seconds a thread has spent on a CPU and waiting on a run queue for one.
+    schedstat counts nanoseconds, where stat only counts clock ticks and has no run queue wait.
+    '''
+    with open(path, 'rb') as schedstat:
+        fields = schedstat.read().split()
+    return int(fields[0]) / 1e9, int(fields[1]) / 1e9
+
+
+class Telemetry():
+    '''
+    Tracks the resident memory, CPU time and thread count of a pokerbot's processes, sampled from /proc.
+    '''
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def __init__(self, process_tree):
+        self.process_tree = process_tree
+        # procfs files are regenerated by every read from the start, so each process's are opened once and reread
+        self.files = {}
+        # processes which exited keep the CPU time they used
+        self.cpu_ticks = {}
+        self.closed = False
+        self.lock = Lock()
+        self.samples = 0
+        self.rss = 0
+        self.peak_rss = 0
+        self.max_threads = 0
+        self.cpu_time = 0.
+        # a pokerbot kept running from an earlier match has already used some CPU
+        self.cpu_start = None
+        self.sample()
+        self.cpu_start = self.cpu_time
+
+    def sample(self):
+        '''
+        Reads the figures of every process in the tree, unless they have all exited.
+        '''
+        with self.lock:
+            if self.closed:
+                return
+            pids = self.process_tree.members()
+            for pid in set(self.files) - set(pids):
+                self.close_files(pid)
+            rss = peak_rss = threads = 0
+            sampled = False
+            for pid in pids:
+                try:
+                    if pid not in self.files:
+                        self.open_files(pid)
+                    status_fd, stat_fd = self.files[pid]
+                    status = os.pread(status_fd, 4096, 0)
+                    # the command name may contain spaces, so fields are counted from its closing parenthesis
+                    stat = os.pread(stat_fd, 4096, 0).rpartition(b')')[2].split()
+                except OSError:
+                    continue
+                sampled = True
+                rss += self.status_field(status, b'VmRSS:')
+                # VmHWM is the kernel's own peak, which catches spikes between samples
+                peak_rss += self.status_field(status, b'VmHWM:')
+                threads += self.status_field(status, b'Threads:')
+                self.cpu_ticks[pid] = int(stat[11]) + int(stat[12])
+            if not sampled:
+                return
+            self.samples += 1
+            self.rss = rss
+            self.peak_rss = max(self.peak_rss, peak_rss, rss)
+            self.max_threads = max(self.max_threads, threads)
+            self.cpu_time = sum(self.cpu_ticks.values()) / self.CLOCK_TICKS
+
+    def open_files(self, pid):
+        '''
+        Opens a process's status and stat files.
+        '''
+        status_fd = os.open('/proc/{}/status'.format(pid), os.O_RDONLY)
+        try:
+            stat_fd = os.open('/proc/{}/stat'.format(pid), os.O_RDONLY)
+        except OSError:
+            os.close(status_fd)
+            raise
+        self.files[pid] = (status_fd, stat_fd)
+
+    def close_files(self, pid):
+        '''
+        Closes a process's status and stat files.
+        '''
+        for fd in self.files.pop(pid):
+            os.close(fd)
+
+    @staticmethod
+    def status_field(status, name):
+        '''
+        Returns the number after a name in /proc/<pid>/status, or 0 when it is missing, as it is for zombies.
+        '''
+        start = status.find(name)
+        if start < 0:
+            return 0
+        return int(status[start + len(name):status.find(b'\n', start)].split()[0])
+
+    def close(self):
+        '''
+        Closes the procfs files.
+        '''
+        with self.lock:
+            for pid in list(self.files):
+                self.close_files(pid)
+            self.closed = True
+
+    def summary(self):
+        '''
+        Returns the figures in megabytes and seconds.
+        '''
+        with self.lock:
+            return {'samples': self.samples, 'rss_mb': self.rss / 1024, 'peak_rss_mb': self.peak_rss / 1024,
+                    'cpu': self.cpu_time - (self.cpu_start or 0.), 'max_threads': self.max_threads}
+
+
+class TelemetrySampler():
+    '''
+    Samples every pokerbot in the process every TELEMETRY_INTERVAL seconds from a single thread.
+    '''
+
+    def __init__(self):
+        self.telemetries = set()
+        self.lock = Lock()
+        self.thread = None
+
+    def add(self, telemetry):
+        '''
+        Starts sampling a pokerbot, starting the thread, which dies with the program, on first use.
+        '''
+        with self.lock:
+            self.telemetries.add(telemetry)
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def remove(self, telemetry):
+        '''
+        Stops sampling a pokerbot.
+        '''
+        with self.lock:
+            self.telemetries.discard(telemetry)
+
+    def run(self):
+        '''
+        Samples until the program exits.
+        '''
+        while True:
+            time.sleep(TELEMETRY_INTERVAL)
+            with self.lock:
+                telemetries = list(self.telemetries)
+            for telemetry in telemetries:
+                telemetry.sample()
+
+
+TELEMETRY_SAMPLER = TelemetrySampler()
+
+
+class RingFile():
+    '''
+    A file-like byte stream over a pair of single-producer, single-consumer rings in shared memory.
+    '''
+    HEADER = struct.Struct('<QQQ')  # bytes written, bytes read, closed flag
+    CAPACITY = 65536
+    SPINS = 1000
+
+    def __init__(self, shm, outgoing, timeout=None, alive=None, owner=False):
+        self.shm = shm
+        ring_size = self.HEADER.size + self.CAPACITY
+        rings = [shm.buf[0:ring_size], shm.buf[ring_size:2 * ring_size]]
+        self.outgoing = rings[outgoing]
+        self.incoming = rings[1 - outgoing]
+        self.buffer = bytearray()
+        self.timeout = timeout
+        self.alive = alive
+        self.owner = owner
+
+    def wait(self, spins, deadline):
+        '''
+        Spins briefly, then sleeps, while the other side catches up.
+        '''
+        if spins < self.SPINS:
+            os.sched_yield()
+        else:
+            time.sleep(0.0001)
+            if deadline is not None and time.perf_counter() > deadline:
+                raise socket.timeout
+            if self.alive is not None and not self.alive():
+                raise ConnectionError
+
+    def write(self, data):
+        '''
+        Copies bytes into the outgoing ring, waiting for space when it is full.
+        '''
+        view = memoryview(data)
+        spins = 0
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while len(view) > 0:
+            written, read, _ = self.HEADER.unpack_from(self.outgoing)
+            chunk = min(self.CAPACITY - (written - read), len(view))
+            if chunk == 0:
+                self.wait(spins, deadline)
+                spins += 1
+                continue
+            position = written % self.CAPACITY
+            first = min(chunk, self.CAPACITY - position)
+            start = self.HEADER.size + position
+            self.outgoing[start:start + first] = view[:first]
+            self.outgoing[self.HEADER.size:self.HEADER.size + chunk - first] = view[first:chunk]
+            struct.pack_into('<Q', self.outgoing, 0, written + chunk)
+            view = view[chunk:]
+        return len(data)
+
+    def fill(self):
+        '''
+        Moves every available byte from the incoming ring into the buffer, returning False at end of stream.
+        '''
+        spins = 0
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            written, read, closed = self.HEADER.unpack_from(self.incoming)
+            if written > read:
+                position = read % self.CAPACITY
+                first = min(written - read, self.CAPACITY - position)
+                start = self.HEADER.size + position
+                self.buffer += self.incoming[start:start + first]
+                self.buffer += self.incoming[self.HEADER.size:self.HEADER.size + written - read - first]
+                struct.pack_into('<Q', self.incoming, 8, written)
+                return True
+            if closed:
+                return False
+            try:
+                self.wait(spins, deadline)
+            except ConnectionError:
+                return False
+            spins += 1
+
+    def readline(self):
+        '''
+        Reads up to and including the next newline.
+        '''
+        while b'\n' not in self.buffer and self.fill():
+            pass
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return line
+
+    def read(self, size):
+        '''
+        Reads exactly size bytes, or fewer at end of stream.
+        '''
+        while len(self.buffer) < size and self.fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def flush(self):
+        '''
+        Writes are visible to the other side as soon as they are copied.
+        '''
+
+    def close(self):
+        '''
+        Marks the outgoing ring closed and releases the shared memory.
+        '''
+        if self.outgoing is not None:
+            struct.pack_into('<Q', self.outgoing, 16, 1)
+            self.outgoing.release()
+            self.incoming.release()
+            self.outgoing = self.incoming = None
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+
+
+class TCPListener():
+    '''
+    Accepts the pokerbot's connection on an ephemeral loopback TCP port.
+    '''
+
+    def __init__(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('', 0))
+        self.server_socket.settimeout(CONNECT_TIMEOUT)
+        self.server_socket.listen()
+        self.args = [str(self.server_socket.getsockname()[1])]
+        self.pass_fds = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server_socket.close()
+
+    def accept(self, proc):
+        '''
+        Blocks until we timeout or the player connects.
+        '''
+        client_socket, _ = self.server_socket.accept()
+        with client_socket:
+            client_socket.settimeout(CONNECT_TIMEOUT)
+            return client_socket.makefile('rwb')
+
+
+class UnixListener(TCPListener):
+    '''
+    Accepts the pokerbot's connection on a Unix domain socket in a temporary directory.
+    '''
+
+    def __init__(self):  # pylint: disable=super-init-not-called
+        self.directory = tempfile.mkdtemp(prefix='pokerbots')
+        path = os.path.join(self.directory, 'engine.sock')
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(path)
+        self.server_socket.settimeout(CONNECT_TIMEOUT)
+        self.server_socket.listen()
+        self.args = ['--unix', path]
+        self.pass_fds = ()
+
+    def __exit__(self, *exc_info):
+        self.server_socket.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SocketpairListener():
+    '''
+    Hands the pokerbot one end of a connected socket pair, which it inherits as a file descriptor.
+    '''
+
+    def __init__(self):
+        self.engine_socket, self.bot_socket = socket.socketpair()
+        self.args = ['--fd', str(self.bot_socket.fileno())]
+        self.pass_fds = (self.bot_socket.fileno(),)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.bot_socket.close()
+        self.engine_socket.close()
+
+    def accept(self, proc):
+        '''
+        The pokerbot is connected as soon as it has started.
+        '''
+        self.bot_socket.close()
+        self.engine_socket.settimeout(CONNECT_TIMEOUT)
+        return self.engine_socket.makefile('rwb')
+
+
+class SharedMemoryListener():
+    '''
+    Creates a shared-memory ring pair which the pokerbot attaches to by name.
+    '''
+
+    def __init__(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=2 * (RingFile.HEADER.size + RingFile.CAPACITY))
+        # a forked pokerbot's parent is its fork server, so the engine tells it which process to outlive
+        self.args = ['--shm', self.shm.name, '--engine-pid', str(os.getpid())]
+        self.pass_fds = ()
+        self.ring_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.ring_file is None:
+            self.shm.close()
+            self.shm.unlink()
+
+    def accept(self, proc):
+        '''
+        The pokerbot is connected as soon as the rings exist; reads fail once it exits.
+        '''
+        self.ring_file = RingFile(self.shm, 0, CONNECT_TIMEOUT, lambda: proc.poll() is None, owner=True)
+        return self.ring_file
+
+
+LISTENERS = {'tcp': TCPListener, 'unix': UnixListener, 'socketpair': SocketpairListener, 'shm': SharedMemoryListener}
+
+
+BUILD_CACHE_FILENAME = '.build_cache'
+
+
+def tree_hash(path, build_command):
+    '''
+    Hashes the build command and every file under a pokerbot's directory, including what its last build produced.
+    '''
+    digest = hashlib.sha256(json.dumps(build_command).encode())
+    for directory, subdirectories, filenames in os.walk(path):
+        # bytecode is rewritten whenever a pokerbot runs, so it never invalidates a build
+        subdirectories[:] = sorted(name for name in subdirectories if name != '__pycache__')
+        for filename in sorted(filenames):
+            if directory == path and filename == BUILD_CACHE_FILENAME:
+                continue
+            filepath = os.path.join(directory, filename)
+            digest.update(os.path.relpath(filepath, path).encode() + b'\0')
+            with open(filepath, 'rb') as source_file:
+                for chunk in iter(lambda: source_file.read(65536), b''):
+                    digest.update(chunk)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+@contextmanager
+def build_lock(path):
+    '''
+    Holds the lock which every engine on the machine takes to check, build and record the pokerbot at path,
+    so that concurrent matches build it once and the others find the build up to date.
+    The lock file lives outside the pokerbot's directory, whose files are hashed.
+    '''
+    key = hashlib.sha256(os.path.realpath(path).encode()).hexdigest()[:16]
+    try:
+        lock_file = open(os.path.join(tempfile.gettempdir(), 'pokerbots-build-{}.lock'.format(key)), 'a')
+    except OSError:
+        lock_file = None
+    try:
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+
+FORK_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forkserver.py')
+
+
+class ForkedProcess():
+    '''
+    Stands in for the Popen of a pokerbot forked by a fork server, which reports when the pokerbot exits.
+    '''
+
+    def __init__(self, control, stdout):
+        self.control = control
+        self.stdout = stdout
+        self.buffer = b''
+        self.returncode = None
+        self.pid = self.read_message(CONNECT_TIMEOUT)['pid']
+
+    def read_message(self, timeout):
+        '''
+        Reads the fork server's next message, raising socket.timeout when none arrives in time.
+        '''
+        self.control.settimeout(timeout)
+        while b'\n' not in self.buffer:
+            data = self.control.recv(4096)
+            if not data:
+                # the fork server is gone, so nothing will report how the pokerbot exited
+                return {'returncode': -1}
+            self.buffer += data
+        line, _, self.buffer = self.buffer.partition(b'\n')
+        return json.loads(line.decode())
+
+    def wait(self, timeout=None):
+        '''
+        Waits for the pokerbot to exit and returns its exit code.
+        '''
+        if self.returncode is None:
+            try:
+                self.returncode = self.read_message(timeout)['returncode']
+            except socket.timeout:
+                raise subprocess.TimeoutExpired(FORK_SERVER_PATH, timeout)
+            self.control.close()
+        return self.returncode
+
+    def poll(self):
+        '''
+        Returns the pokerbot's exit code, or None while it is running.
+        '''
+        try:
+            return self.wait(0.)
+        except (subprocess.TimeoutExpired, BlockingIOError):
+            return None
+
+    def kill(self):
+        '''
+        Kills the pokerbot, which its fork server then reports.
+        '''
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def fork_pokerbot(path, run_command, args, pass_fds, output):
+    '''
+    Forks a Python pokerbot from the fork server for its directory, starting the server if none is running.
+    Returns None when no server can load the pokerbot, whose load errors are captured in its output.
+    '''
+    # a changed pokerbot gets a new fork server, and the stale one exits once idle
+    key = hashlib.sha256((os.path.realpath(path) + tree_hash(path, run_command)).encode()).hexdigest()[:16]
+    socket_path = os.path.join(tempfile.gettempdir(), 'pokerbots-fork-{}.sock'.format(key))
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server = None
+    deadline = time.perf_counter() + CONNECT_TIMEOUT
+    while True:
+        try:
+            control.connect(socket_path)
+            break
+        except OSError:
+            if server is not None and server.poll() is not None:
+                if server.returncode != 0:
+                    output.put(server.stderr.read())
+                    server.stderr.close()
+                    control.close()
+                    return None
+                # a server started by another match at the same time won the socket, and may have left it since
+                server.stderr.close()
+                server = None
+            if time.perf_counter() > deadline:
+                control.close()
+                return None
+            if server is None:
+                # the server outlives this match, so it gets its own session and no terminal
+                server = subprocess.Popen(run_command[:-1] + [FORK_SERVER_PATH, socket_path, run_command[-1],
+                                                              '--idle-timeout', str(FORK_SERVER_IDLE_TIMEOUT)],
+                                          stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.PIPE, cwd=path, start_new_session=True)
+            time.sleep(0.01)
+    read_fd, write_fd = os.pipe()
+    try:
+        request = {'args': args, 'pass_fds': list(pass_fds), 'nice': os.nice(0)}
+        # the fork server was started by whichever engine came first, so its cores need not be this engine's
+        if hasattr(os, 'sched_getaffinity'):
+            request['affinity'] = sorted(os.sched_getaffinity(0))
+        message = json.dumps(request).encode()
+        socket.send_fds(control, [message], [write_fd] + list(pass_fds))
+    except OSError:
+        os.close(read_fd)
+        control.close()
+        if server is not None:
+            server.stderr.close()
+        return None
+    finally:
+        os.close(write_fd)
+    stdout = os.fdopen(read_fd, 'rb')
+    try:
+        return ForkedProcess(control, stdout)
+    except (OSError, KeyError, ValueError):
+        stdout.close()
+        control.close()
+        if server is not None:
+            # a fork server which cannot load the pokerbot exits, and its load errors belong in the player log
+            try:
+                output.put(server.communicate(timeout=1.)[1])
+            except subprocess.TimeoutExpired:
+                pass
+        return None
+    finally:
+        if server is not None:
+            server.stderr.close()
+
+
+class Player():
+    '''
+    Handles subprocess and socket interactions with one player's pokerbot.
+    '''
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.commands = None
+        self.bot_subprocess = None
+        self.process_tree = None
+        self.output_closed = None
+        self.transport = None
+        self.listener = None
+        self.socketfile = None
+        self.dispatcher = None
+        self.features = set()
+        self.reset()
+
+    def reset(self):
+        '''
+        Starts the game clock, bankroll, player log and timings of a new match.
+        '''
+        self.game_clock = STARTING_GAME_CLOCK
+        self.bankroll = 0
+        self.adjusted_bankroll = 0.
+        self.output = OutputCapture(self.name + '.txt')
+        self.latency = None
+        self.latencies = {}
+        self.wait_time = 0.
+        self.io_time = 0.
+        self.cpu_used = 0.
+        self.queued_time = 0.
+        self.wall_time = 0.
+        self.charged_time = 0.
+        self.telemetry = None
+
+    def build(self):
+        '''
+        Loads the commands file and builds the pokerbot.
+        '''
+        try:
+            with open(self.path + '/commands.json', 'r') as json_file:
+                commands = json.load(json_file)
+            if ('build' in commands and 'run' in commands and
+                    isinstance(commands['build'], list) and
+                    isinstance(commands['run'], list)):
+                self.commands = commands
+            else:
+                print(self.name, 'commands.json missing command')
+        except FileNotFoundError:
+            print(self.name, 'commands.json not found - check PLAYER_PATH')
+        except json.decoder.JSONDecodeError:
+            print(self.path)
+            print(self.name, 'commands.json misformatted')
+        if self.commands is not None and len(self.commands['build']) > 0:
+            with build_lock(self.path):
+                self.run_build()
+
+    def run_build(self):
+        '''
+        Runs the build command, unless the build cache shows that the pokerbot is already built.
+        '''
+        cache_path = os.path.join(self.path, BUILD_CACHE_FILENAME)
+        if BUILD_CACHE:
+            try:
+                with open(cache_path, 'r') as cache_file:
+                    if cache_file.read().strip() == tree_hash(self.path, self.commands['build']):
+                        print(self.name, 'build is up to date')
+                        return
+            except OSError:
+                pass
+        try:
+            proc = subprocess.run(self.commands['build'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  cwd=self.path, timeout=BUILD_TIMEOUT, check=False)
+            self.output.put(proc.stdout)
+            if BUILD_CACHE and proc.returncode == 0:
+                self.record_build(cache_path)
+        except subprocess.TimeoutExpired as timeout_expired:
+            error_message = 'Timed out waiting for ' + self.name + ' to build'
+            print(error_message)
+            self.output.put(timeout_expired.stdout)
+            self.output.put(error_message.encode())
+        except (TypeError, ValueError):
+            print(self.name, 'build command misformatted')
+        except OSError:
+            print(self.name, 'build failed - check "build" in commands.json')
+
+    def record_build(self, cache_path):
+        '''
+        Records the hash of a successful build, which covers its output too, so deleting or editing it forces a rebuild.
+        '''
+        try:
+            build_hash = tree_hash(self.path, self.commands['build'])
+            # the record is only read and written under the build lock, so it is written in place
+            with open(cache_path, 'w') as cache_file:
+                cache_file.write(build_hash)
+        except OSError:
+            print(self.name, 'build could not be cached')
+
+    def python_script(self):
+        '''
+        Returns whether the pokerbot is run by a Python script, which can be imported or forked instead.
+        '''
+        return (self.commands is not None and len(self.commands['run']) > 0 and
+                'python' in os.path.basename(self.commands['run'][0]) and self.commands['run'][-1].endswith('.py'))
+
+    def prepare(self):
+        '''
+        Builds and launches the pokerbot.
+        '''
+        self.build()
+        self.launch()
+
+    def launch(self):
+        '''
+        Starts the pokerbot, which connects once accepted by connect.
+        '''
+        if self.commands is not None and len(self.commands['run']) > 0:
+            # pokerbots list the transports their skeleton supports, older ones only speak TCP
+            self.transport = TRANSPORT if TRANSPORT in self.commands.get('transports', ['tcp']) else 'tcp'
+            try:
+                self.listener = LISTENERS[self.transport]()
+                proc = None
+                if FORK_SERVER and self.python_script():
+                    proc = fork_pokerbot(self.path, self.commands['run'], self.listener.args,
+                                         self.listener.pass_fds, self.output)
+                    if proc is None:
+                        print(self.name, 'could not be forked, starting it normally')
+                if proc is None:
+                    proc = subprocess.Popen(self.commands['run'] + self.listener.args,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            cwd=self.path, pass_fds=self.listener.pass_fds)
+                self.bot_subprocess = proc
+                self.process_tree = ProcessTree(proc.pid)
+                self.output_closed = OUTPUT_PUMP.add(proc.stdout, self.output)
+                self.start_telemetry()
+            except (TypeError, ValueError):
+                print(self.name, 'run command misformatted')
+            except OSError:
+                print(self.name, 'run failed - check "run" in commands.json')
+            if self.bot_subprocess is None and self.listener is not None:
+                self.listener.__exit__(None, None, None)
+                self.listener = None
+
+    def start_telemetry(self):
+        '''
+        Starts sampling the pokerbot's process for this match.
+        '''
+        if TELEMETRY and self.process_tree is not None:
+            self.telemetry = Telemetry(self.process_tree)
+            TELEMETRY_SAMPLER.add(self.telemetry)
+
+    def stop_telemetry(self):
+        '''
+        Stops sampling the pokerbot's process.
+        '''
+        if self.telemetry is not None:
+            TELEMETRY_SAMPLER.remove(self.telemetry)
+            self.telemetry.close()
+
+    def connect(self):
+        '''
+        Establishes the socket connection with the launched pokerbot.
+        '''
+        if self.listener is not None:
+            with self.listener as listener:
+                try:
+                    self.socketfile = listener.accept(self.bot_subprocess)
+                    print(self.name, 'connected successfully', 'over', self.transport)
+                    self.negotiate()
+                except socket.timeout:
+                    print('Timed out waiting for', self.name, 'to connect')
+                except OSError:
+                    print(self.name, 'run failed - check "run" in commands.json')
+            self.listener = None
+
+    def negotiate(self):
+        '''
+        Offers the enabled protocol features and records the ones the pokerbot accepts.
+        '''
+        offered = offered_features()
+        if len(offered) > 0:
+            self.socketfile.write(('V' + ','.join(offered) + '\n').encode())
+            self.socketfile.flush()
+            clause = self.socketfile.readline().decode().strip()
+            if clause[:1] == 'V':
+                self.features = set(clause[1:].split(',')) & set(offered)
+            print(self.name, 'accepted protocol features:', ', '.join(sorted(self.features)) or 'none')
+
+    def encode(self, clauses):
+        '''
+        Encodes one message.
+        '''
+        return (' '.join(clauses) + '\n').encode()
+
+    def read_clause(self):
+        '''
+        Reads the pokerbot's response.
+        '''
+        return self.socketfile.readline().decode().strip()
+
+    def schedstat(self):
+        '''
+        Returns the seconds every process of the pokerbot has so far spent on a CPU and waiting for one
+        with the cpu game clock, otherwise None.
+        '''
+        if GAME_CLOCK_MODE != 'cpu' or self.process_tree is None:
+            return None
+        return self.process_tree.schedstat()
+
+    def charge(self, wall_time, start):
+        '''
+        Charges the game clock for one response which took wall_time to arrive.
+        The cpu game clock charges the wall time less the time the pokerbot spent waiting for a CPU since start,
+        forgiving at most CPU_CLOCK_ALLOWANCE of the rest for messages in transit, and never less than its CPU time,
+        so that a pokerbot kept off the CPU by other processes is not charged for it but one which sleeps is.
+        Returns the schedstat the charge ended at.
+        '''
+        end = self.schedstat()
+        if start is None or end is None:
+            charged_time = wall_time
+        else:
+            cpu_used = end[0] - start[0]
+            queued_time = end[1] - start[1]
+            self.cpu_used += cpu_used
+            self.queued_time += queued_time
+            charged_time = cpu_used + max(0., wall_time - queued_time - cpu_used - CPU_CLOCK_ALLOWANCE)
+        self.wall_time += wall_time
+        self.charged_time += charged_time
+        if ENFORCE_GAME_CLOCK:
+            self.game_clock -= charged_time
+        return end
+
+    def start_tables(self, count):
+        '''
+        Routes the pokerbot's responses to the tables they belong to from a thread which dies with the program.
+        '''
+        self.game_clock = STARTING_GAME_CLOCK * count
+        self.write_lock = Lock()
+        self.sent_times = [0.] * count
+        self.replies = [Queue() for _ in range(count)]
+        self.dispatcher = Thread(target=self.dispatch_replies, daemon=True)
+        self.dispatcher.start()
+
+    def dispatch_replies(self):
+        '''
+        Reads the pokerbot's responses for every table and hands each to its table.
+        The pokerbot answers its messages in order, so it is only charged from when it could start on each one.
+        '''
+        busy_until = 0.
+        start = self.schedstat()
+        try:
+            while True:
+                table_clause, _, clause = self.read_clause().partition(' ')
+                end_time = time.perf_counter()
+                table = int(table_clause[1:])
+                service_time = end_time - max(self.sent_times[table], busy_until)
+                busy_until = end_time
+                self.wait_time += service_time
+                # the pokerbot answers in order, so its CPU time since the last response went into this one
+                start = self.charge(service_time, start)
+                if self.telemetry is not None:
+                    self.telemetry.sample()
+                self.replies[table].put((clause, end_time))
+        except (OSError, IndexError, ValueError):
+            # every table sees the disconnection
+            for replies in self.replies:
+                replies.put(None)
+
+    def accepts_matches(self):
+        '''
+        Returns whether the pokerbot can be kept running for another match.
+        '''
+        return 'matches' in self.features
 
-    def __init__(self, name, path):
-        self.name = name
-        self.path = path
-        self.game_clock = STARTING_GAME_CLOCK
-        self.bankroll = 0
-        self.commands = None
-        self.bot_subprocess = None
-        self.socketfile = None
-        self.bytes_queue = Queue()
+    def end_match(self, pending_clauses=()):
+        '''
+        Tells the pokerbot that another match follows instead of stopping it, and writes the player log.
+        Clauses which were never sent precede N. Returns whether the pokerbot is still running.
+        '''
+        try:
+            if self.exchange(self.encode(list(pending_clauses) + ['N'])) == 'K':
+                # the pokerbot flushes its output before acking, so everything it printed is already in the pipe
+                if self.bot_subprocess is not None:
+                    OUTPUT_PUMP.redirect(self.bot_subprocess.stdout, self.output).wait()
+                self.output.save()
+                return True
+        except (OSError, ValueError):
+            pass
+        print(self.name, 'could not be kept running for the next match')
+        self.stop()
+        return False
 
-    def build(self):
+    def forget(self, pending_clauses=()):
         '''
-        Loads the commands file and builds the pokerbot.
+        Tells a pokerbot which accepts matches to start over as if a new match began, without ending this one.
+        Clauses which were never sent precede N. Returns whether they were delivered.
         '''
+        if not self.accepts_matches() or not self.queryable():
+            return False
         try:
-            with open(self.path + '/commands.json', 'r') as json_file:
-                commands = json.load(json_file)
-            if ('build' in commands and 'run' in commands and
-                    isinstance(commands['build'], list) and
-                    isinstance(commands['run'], list)):
-                self.commands = commands
-            else:
-                print(self.name, 'commands.json missing command')
-        except FileNotFoundError:
-            print(self.name, 'commands.json not found - check PLAYER_PATH')
-        except json.decoder.JSONDecodeError:
-            print(self.path)
-            print(self.name, 'commands.json misformatted')
-        if self.commands is not None and len(self.commands['build']) > 0:
-            try:
-                proc = subprocess.run(self.commands['build'],
-                                      stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                      cwd=self.path, timeout=BUILD_TIMEOUT, check=False)
-                self.bytes_queue.put(proc.stdout)
-            except subprocess.TimeoutExpired as timeout_expired:
-                error_message = 'Timed out waiting for ' + self.name + ' to build'
-                print(error_message)
-                self.bytes_queue.put(timeout_expired.stdout)
-                self.bytes_queue.put(error_message.encode())
-            except (TypeError, ValueError):
-                print(self.name, 'build command misformatted')
-            except OSError:
-                print(self.name, 'build failed - check "build" in commands.json')
+            self.exchange(self.encode(list(pending_clauses) + ['N']))
+            return True
+        except OSError:
+            print(self.name, 'disconnected')
+            self.game_clock = 0.
+        return False
 
-    def run(self):
+    def begin_match(self):
         '''
-        Runs the pokerbot and establishes the socket connection.
+        Prepares a pokerbot kept running by the previous match to play this one.
         '''
-        if self.commands is not None and len(self.commands['run']) > 0:
-            try:
-                server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                with server_socket:
-                    server_socket.bind(('', 0))
-                    server_socket.settimeout(CONNECT_TIMEOUT)
-                    server_socket.listen()
-                    port = server_socket.getsockname()[1]
-                    proc = subprocess.Popen(self.commands['run'] + [str(port)],
-                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                            cwd=self.path)
-                    self.bot_subprocess = proc
-                    # function for bot listening
-                    def enqueue_output(out, queue):
-                        try:
-                            for line in out:
-                                queue.put(line)
-                        except ValueError:
-                            pass
-                    # start a separate bot listening thread which dies with the program
-                    Thread(target=enqueue_output, args=(proc.stdout, self.bytes_queue), daemon=True).start()
-                    # block until we timeout or the player connects
-                    client_socket, _ = server_socket.accept()
-                    with client_socket:
-                        client_socket.settimeout(CONNECT_TIMEOUT)
-                        sock = client_socket.makefile('rw')
-                        self.socketfile = sock
-                        print(self.name, 'connected successfully')
-            except (TypeError, ValueError):
-                print(self.name, 'run command misformatted')
-            except OSError:
-                print(self.name, 'run failed - check "run" in commands.json')
-            except socket.timeout:
-                print('Timed out waiting for', self.name, 'to connect')
+        self.stop_telemetry()
+        self.reset()
+        self.start_telemetry()
+        # the pokerbot prints nothing until it is queried, so everything after this belongs to this match
+        OUTPUT_PUMP.redirect(self.bot_subprocess.stdout, self.output).wait()
+        print(self.name, 'kept running from the previous match')
 
-    def stop(self):
+    def stop(self, pending_clauses=()):
         '''
         Closes the socket connection and stops the pokerbot.
+        Clauses which were never sent, like the last round's result when acks are skipped, precede Q.
         '''
+        self.stop_telemetry()
         if self.socketfile is not None:
             try:
-                self.socketfile.write('Q\n')
+                self.socketfile.write(self.encode(list(pending_clauses) + ['Q']))
+                if self.dispatcher is not None:
+                    # the dispatcher is still reading, so let it see the pokerbot disconnect before closing
+                    self.socketfile.flush()
+                    self.dispatcher.join(CONNECT_TIMEOUT)
                 self.socketfile.close()
             except socket.timeout:
                 print('Timed out waiting for', self.name, 'to disconnect')
@@ -261,22 +1476,68 @@ class Player():
                 print('Could not close socket connection with', self.name)
         if self.bot_subprocess is not None:
             try:
-                outs, _ = self.bot_subprocess.communicate(timeout=CONNECT_TIMEOUT)
-                self.bytes_queue.put(outs)
+                self.bot_subprocess.wait(timeout=CONNECT_TIMEOUT)
             except subprocess.TimeoutExpired:
                 print('Timed out waiting for', self.name, 'to quit')
                 self.bot_subprocess.kill()
-                outs, _ = self.bot_subprocess.communicate()
-                self.bytes_queue.put(outs)
-        with open(self.name + '.txt', 'wb') as log_file:
-            bytes_written = 0
-            for output in self.bytes_queue.queue:
-                try:
-                    bytes_written += log_file.write(output)
-                    if bytes_written >= PLAYER_LOG_SIZE_LIMIT:
-                        break
-                except TypeError:
-                    pass
+                self.bot_subprocess.wait()
+            # processes the pokerbot started may still hold its output open
+            if not self.output_closed.wait(CONNECT_TIMEOUT):
+                print('Timed out waiting for', self.name, 'to close its output')
+            OUTPUT_PUMP.remove(self.bot_subprocess.stdout, self.output_closed)
+            self.output_closed.wait()
+        self.output.save()
+
+    def record_latency(self, street, code):
+        '''
+        Adds the latency of the last query to the histogram for its street and the action the pokerbot sent.
+        '''
+        if LATENCY_REPORT and self.latency is not None:
+            key = (street, code)
+            if key not in self.latencies:
+                self.latencies[key] = LatencyHistogram()
+            self.latencies[key].add(self.latency)
+
+    @staticmethod
+    def decode(clause, round_state, legal_actions):
+        '''
+        Decodes an action clause, returning None if the action is illegal.
+        '''
+        action = DECODE[clause[0]]
+        if action in legal_actions:
+            if clause[0] == 'R':
+                amount = int(clause[1:])
+                min_raise, max_raise = round_state.raise_bounds()
+                if min_raise <= amount <= max_raise:
+                    return action(amount)
+            else:
+                return action()
+        return None
+
+    def exchange(self, message):
+        '''
+        Sends one encoded message and returns the pokerbot's response, charging the time it took to the game clock.
+        '''
+        start = self.schedstat()
+        start_time = time.perf_counter()
+        self.socketfile.write(message)
+        self.socketfile.flush()
+        sent_time = time.perf_counter()
+        clause = self.read_clause()
+        end_time = time.perf_counter()
+        self.latency = end_time - sent_time
+        self.wait_time += self.latency
+        self.io_time += sent_time - start_time
+        self.charge(end_time - start_time, start)
+        if self.telemetry is not None:
+            self.telemetry.sample()
+        return clause
+
+    def queryable(self):
+        '''
+        Returns whether the pokerbot is still connected and has time left, so that it will be queried again.
+        '''
+        return self.socketfile is not None and self.game_clock > 0.
 
     def query(self, round_state, player_message, game_log):
         '''
@@ -284,31 +1545,23 @@ class Player():
         At the end of the round, we request a CheckAction from the pokerbot.
         '''
         legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else {CheckAction}
-        if self.socketfile is not None and self.game_clock > 0.:
+        self.latency = None
+        if self.queryable():
             clause = ''
             try:
                 player_message[0] = 'T{:.3f}'.format(self.game_clock)
-                message = ' '.join(player_message) + '\n'
+                message = self.encode(player_message)
                 del player_message[1:]  # do not send redundant action history
-                start_time = time.perf_counter()
-                self.socketfile.write(message)
-                self.socketfile.flush()
-                clause = self.socketfile.readline().strip()
-                end_time = time.perf_counter()
-                if ENFORCE_GAME_CLOCK:
-                    self.game_clock -= end_time - start_time
+                clause = self.exchange(message)
+                # an illegal or misformatted response is replaced by a check or fold, but is timed as what it was
+                self.record_latency(round_state.street if isinstance(round_state, RoundState) else 'ack',
+                                    clause[0] if clause[:1] in DECODE else '?')
                 if self.game_clock <= 0.:
                     raise socket.timeout
-                action = DECODE[clause[0]]
-                if action in legal_actions:
-                    if clause[0] == 'R':
-                        amount = int(clause[1:])
-                        min_raise, max_raise = round_state.raise_bounds()
-                        if min_raise <= amount <= max_raise:
-                            return action(amount)
-                    else:
-                        return action()
-                game_log.append(self.name + ' attempted illegal ' + action.__name__)
+                action = self.decode(clause, round_state, legal_actions)
+                if action is not None:
+                    return action
+                game_log.append(self.name + ' attempted illegal ' + DECODE[clause[0]].__name__)
             except socket.timeout:
                 error_message = self.name + ' ran out of time'
                 game_log.append(error_message)
@@ -324,14 +1577,445 @@ class Player():
         return CheckAction() if CheckAction in legal_actions else FoldAction()
 
 
+class MemoryFile():
+    '''
+    One end of an in-memory byte stream, which reads what the other end wrote.
+    '''
+
+    def __init__(self, incoming, outgoing):
+        self.incoming = incoming
+        self.outgoing = outgoing
+
+    def readline(self):
+        '''
+        Reads up to and including the next newline.
+        '''
+        end = self.incoming.find(b'\n') + 1 or len(self.incoming)
+        line = bytes(self.incoming[:end])
+        del self.incoming[:end]
+        return line
+
+    def read(self, size):
+        '''
+        Reads at most size bytes.
+        '''
+        data = bytes(self.incoming[:size])
+        del self.incoming[:size]
+        return data
+
+    def write(self, data):
+        '''
+        Appends bytes for the other end to read.
+        '''
+        self.outgoing += data
+        return len(data)
+
+    def flush(self):
+        '''
+        Writes are visible to the other end as soon as they are appended.
+        '''
+
+    def close(self):
+        '''
+        There is nothing to release.
+        '''
+
+
+class RunnerFile(MemoryFile):
+    '''
+    Stands in for the connection to an imported pokerbot, whose own Runner handles what the engine wrote
+    on the engine's thread as soon as the engine reads the reply.
+    '''
+
+    def __init__(self, runner_class, pokerbot, output):
+        to_runner = bytearray()
+        super().__init__(bytearray(), to_runner)
+        self.runner = runner_class(pokerbot, MemoryFile(to_runner, self.incoming))
+        self.output = output
+        self.crashed = False
+
+    def run(self):
+        '''
+        Lets the Runner handle every message written so far, raising ConnectionError once the pokerbot crashes.
+        A pokerbot which calls sys.exit has crashed too, rather than stopping the engine.
+        '''
+        if self.crashed:
+            raise ConnectionError
+        try:
+            with redirect_stdout(self.output):
+                while len(self.outgoing) > 0:
+                    if not self.runner.handle(next(self.runner.receive())):
+                        del self.outgoing[:]
+        except KeyboardInterrupt:
+            raise
+        except BaseException:  # pylint: disable=broad-except
+            self.output.write(traceback.format_exc())
+            self.crashed = True
+            raise ConnectionError
+
+    def readline(self):
+        '''
+        Reads the Runner's reply to what the engine wrote.
+        '''
+        self.run()
+        return super().readline()
+
+    def close(self):
+        '''
+        Delivers what the engine wrote last, which ends with Q, to a pokerbot which has not crashed.
+        '''
+        if not self.crashed:
+            try:
+                self.run()
+            except ConnectionError:
+                # the traceback is already in the player log
+                pass
+
+
+class LocalPlayer(Player):
+    '''
+    Drives one player's Python pokerbot inside the engine process, without a subprocess or socket.
+    Pokerbots which are not run by a Python script fall back to the subprocess and socket.
+    '''
+
+    def __init__(self, name, path):
+        super().__init__(name, path)
+        self.pokerbot = None
+
+    def launch(self):
+        '''
+        Starts pokerbots which are not imported; importing waits for connect, since both imports share sys.modules.
+        '''
+        if not self.python_script():
+            super().launch()
+
+    def connect(self):
+        '''
+        Imports the pokerbot's Player class and constructs it from the pokerbot's directory,
+        connecting it to the engine through its own skeleton's Runner.
+        '''
+        if not self.python_script():
+            super().connect()
+            return
+        script = self.commands['run'][-1]
+        path = os.path.abspath(self.path)
+        # every pokerbot ships its own copy of the skeleton package, so hide any other copy while importing
+        saved_modules = {module_name: sys.modules.pop(module_name) for module_name in list(sys.modules)
+                         if module_name == 'skeleton' or module_name.startswith('skeleton.')}
+        cwd = os.getcwd()
+        sys.path.insert(0, path)
+        runner_class = None
+        try:
+            os.chdir(path)
+            spec = importlib.util.spec_from_file_location('pokerbot_' + self.name, os.path.join(path, script))
+            module = importlib.util.module_from_spec(spec)
+            with redirect_stdout(self.output):
+                spec.loader.exec_module(module)
+                pokerbot = module.Player()
+            runner_class = sys.modules['skeleton.runner'].Runner
+            if hasattr(runner_class, 'handle'):
+                self.pokerbot = pokerbot
+                self.socketfile = RunnerFile(runner_class, pokerbot, self.output)
+                print(self.name, 'loaded successfully')
+        except KeyboardInterrupt:
+            raise
+        except BaseException:  # pylint: disable=broad-except
+            self.output.write(traceback.format_exc())
+            print(self.name, 'import failed - check "run" in commands.json')
+        finally:
+            os.chdir(cwd)
+            sys.path.remove(path)
+            for module_name in [module_name for module_name in sys.modules
+                                if module_name == 'skeleton' or module_name.startswith('skeleton.')]:
+                del sys.modules[module_name]
+            sys.modules.update(saved_modules)
+        if runner_class is not None and self.pokerbot is None:
+            # a skeleton whose Runner cannot be handed one message at a time is run as a subprocess
+            print(self.name, 'skeleton predates in-process play, starting it normally')
+            super().launch()
+            super().connect()
+
+    def schedstat(self):
+        '''
+        Imported pokerbots run on the engine's thread, so they use its times.
+        '''
+        if self.pokerbot is None:
+            return super().schedstat()
+        if GAME_CLOCK_MODE != 'cpu':
+            return None
+        # schedstat only catches up with a running thread's CPU time at the next tick, thread_time is exact
+        try:
+            queued_time = read_schedstat('/proc/thread-self/schedstat')[1]
+        except (OSError, ValueError, IndexError):
+            queued_time = 0.
+        return time.thread_time(), queued_time
+
+    def accepts_matches(self):
+        '''
+        Imported pokerbots are always reset in place.
+        '''
+        return self.pokerbot is not None or super().accepts_matches()
+
+    def begin_match(self):
+        '''
+        Prepares a pokerbot imported by the previous match to play this one.
+        '''
+        if self.pokerbot is None:
+            super().begin_match()
+            return
+        self.reset()
+        self.socketfile.output = self.output
+        print(self.name, 'kept loaded from the previous match')
+
+
+class LatencyHistogram():
+    '''
+    Counts latencies in logarithmic buckets, so memory does not grow with NUM_ROUNDS.
+    '''
+    MIN_LATENCY = 1e-6
+    BUCKETS_PER_DECADE = 20
+    NUM_BUCKETS = 160  # up to 100 seconds
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.max = 0.
+
+    def add(self, latency):
+        '''
+        Counts one latency in seconds.
+        '''
+        bucket = 0
+        if latency > self.MIN_LATENCY:
+            bucket = min(int(math.log10(latency / self.MIN_LATENCY) * self.BUCKETS_PER_DECADE), self.NUM_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.max = max(self.max, latency)
+
+    def percentile(self, fraction):
+        '''
+        Returns the upper edge of the bucket holding the given fraction of latencies, at most the maximum.
+        '''
+        rank = math.ceil(fraction * self.count)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.MIN_LATENCY * 10 ** ((bucket + 1) / self.BUCKETS_PER_DECADE), self.max)
+        return self.max
+
+    def merge(self, other):
+        '''
+        Adds the latencies counted by another histogram.
+        '''
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        '''
+        Returns the count, p50, p95, p99 and maximum.
+        '''
+        return {'count': self.count, 'p50': self.percentile(.5), 'p95': self.percentile(.95),
+                'p99': self.percentile(.99), 'max': self.max}
+
+
+class RunningStats():
+    '''
+    Accumulates the mean and variance of a stream of samples in constant memory.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.sum_squares = 0.
+
+    def add(self, sample):
+        '''
+        Incorporates one sample using Welford's update.
+        '''
+        self.count += 1
+        difference = sample - self.mean
+        self.mean += difference / self.count
+        self.sum_squares += difference * (sample - self.mean)
+
+    def variance(self):
+        '''
+        Returns the sample variance.
+        '''
+        return self.sum_squares / (self.count - 1) if self.count > 1 else 0.
+
+    def stdev(self):
+        '''
+        Returns the sample standard deviation.
+        '''
+        return math.sqrt(self.variance())
+
+
+class SequentialTest():
+    '''
+    Decides whether the mean of a stream of samples is at least delta, at most -delta or zero,
+    by running two one-sided sequential probability ratio tests with the variance estimated from the samples.
+    '''
+
+    def __init__(self, delta, min_samples):
+        self.stats = RunningStats()
+        self.delta = delta
+        self.min_samples = min_samples
+        self.upper = math.log((1 - SPRT_BETA) / SPRT_ALPHA)
+        self.lower = math.log(SPRT_BETA / (1 - SPRT_ALPHA))
+        self.rejected = [False, False]
+        # 1 if the mean is positive, -1 if it is negative, 0 if there is no significant difference
+        self.decision = None
+
+    def log_ratios(self):
+        '''
+        Returns the log likelihood ratios of a mean of delta and of -delta against a mean of zero.
+        '''
+        # identical samples have no variance, which makes every ratio infinitely decisive
+        variance = self.stats.variance() or 1e-12
+        count, mean = self.stats.count, self.stats.mean
+        return (count * self.delta * (mean - self.delta / 2) / variance,
+                count * self.delta * (-mean - self.delta / 2) / variance)
+
+    def add(self, sample):
+        '''
+        Incorporates one sample and returns the decision, which is None while the tests continue.
+        '''
+        self.stats.add(sample)
+        if self.decision is not None or self.stats.count < self.min_samples:
+            return self.decision
+        for index, (side, log_ratio) in enumerate(zip((1, -1), self.log_ratios())):
+            # a test which accepted zero stays decided, however later samples move its ratio
+            if self.rejected[index]:
+                continue
+            if log_ratio >= self.upper:
+                self.decision = side
+                return self.decision
+            if log_ratio <= self.lower:
+                self.rejected[index] = True
+        if all(self.rejected):
+            self.decision = 0
+        return self.decision
+
+
+class Seat(Player):
+    '''
+    Stands in for a player at one of several tables played over the same connection.
+    '''
+
+    def __init__(self, player, table):  # pylint: disable=super-init-not-called
+        self.player = player
+        self.table = table
+        self.name = player.name
+        self.path = player.path
+        self.features = player.features
+        self.bankroll = 0
+        self.adjusted_bankroll = 0.
+        self.latency = None
+        self.latencies = {}
+        self.wait_time = 0.
+        self.io_time = 0.
+
+    # the pokerbot's connection and game clock are shared by all of its tables
+    socketfile = property(lambda self: self.player.socketfile)
+    game_clock = property(lambda self: self.player.game_clock,
+                          lambda self, game_clock: setattr(self.player, 'game_clock', game_clock))
+
+    def accepts_matches(self):
+        '''
+        N would reset every table at once, so a pokerbot playing several is never reset.
+        '''
+        return False
+
+    def encode(self, clauses):
+        '''
+        Encodes one message for this table.
+        '''
+        return self.player.encode(['I' + str(self.table)] + clauses)
+
+    def exchange(self, message):
+        '''
+        Sends one encoded message and waits for the response routed to this table.
+        '''
+        player = self.player
+        with player.write_lock:
+            start_time = time.perf_counter()
+            player.sent_times[self.table] = start_time
+            player.socketfile.write(message)
+            player.socketfile.flush()
+            sent_time = time.perf_counter()
+        try:
+            reply = player.replies[self.table].get(timeout=CONNECT_TIMEOUT)
+        except Empty:
+            raise socket.timeout
+        if reply is None:
+            raise ConnectionError
+        clause, end_time = reply
+        self.latency = end_time - sent_time
+        self.io_time += sent_time - start_time
+        return clause
+
+
+class GameLog():
+    '''
+    Streams game log lines to disk through a buffered writer, so memory does not grow with NUM_ROUNDS.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.log_file = open(name, 'w')
+        self.line_count = 0
+
+    def append(self, line):
+        '''
+        Writes one line to the game log.
+        '''
+        if self.line_count > 0:
+            self.log_file.write('\n')
+        self.log_file.write(line)
+        self.line_count += 1
+
+    def flush(self):
+        '''
+        Pushes the buffered lines to disk.
+        '''
+        self.log_file.flush()
+
+    def close(self):
+        '''
+        Flushes and closes the game log.
+        '''
+        self.log_file.close()
+
+
 class Game():
     '''
     Manages logging and the high-level game procedure.
     '''
 
-    def __init__(self):
-        self.log = ['6.176 MIT Pokerbots - ' + PLAYER_1_NAME + ' vs ' + PLAYER_2_NAME]
+    def __init__(self, table=0, seed=None):
+        # the first table keeps the plain file names, so a single table logs as before
+        self.table = table
+        name = GAME_LOG_FILENAME + ('_{}'.format(table) if table > 0 else '')
+        self.log = GameLog(name + '.txt')
+        self.log.append('6.176 MIT Pokerbots - ' + PLAYER_1_NAME + ' vs ' + PLAYER_2_NAME)
         self.player_messages = [[], []]
+        # without a configured seed, pick one from the OS so that forked engines do not share deals
+        self.seed = SEED if SEED is not None else int.from_bytes(os.urandom(8), 'big')
+        if table > 0:
+            self.seed = '{}/{}'.format(seed, table)
+        self.duplicate = RunningStats() if DUPLICATE else None
+        # in duplicate mode every sample is a deal, which spans two rounds
+        samples_per_round = 0.5 if DUPLICATE else 1
+        self.sprt = SequentialTest(SPRT_DELTA / samples_per_round, SPRT_MIN_ROUNDS * samples_per_round) if SPRT else None
+        self.records = open(name + '.jsonl', 'w') if STRUCTURED_LOG else None
+        self.record = None
+        self.players = None
+        self.first_player = None
+        self.rounds = 0
+        self.kept_players = None
+        self.adjusted_bankrolls = None
 
     def log_round_state(self, players, round_state):
         '''
@@ -342,8 +2026,13 @@ class Game():
             self.log.append('{} posts the blind of {}'.format(players[1].name, BIG_BLIND))
             self.log.append('{} dealt {}'.format(players[0].name, PCARDS(round_state.hands[0])))
             self.log.append('{} dealt {}'.format(players[1].name, PCARDS(round_state.hands[1])))
-            self.player_messages[0] = ['T0.', 'P0', 'H' + CCARDS(round_state.hands[0])]
-            self.player_messages[1] = ['T0.', 'P1', 'H' + CCARDS(round_state.hands[1])]
+            # when acks are skipped the last round's result goes first, unless the pokerbot can no longer be queried
+            pending = [self.player_messages[seat][1:] if SKIP_ROUND_ACKS and players[seat].queryable() else []
+                       for seat in range(2)]
+            self.player_messages[0] = ['T0.'] + pending[0] + ['P0', 'H' + CCARDS(round_state.hands[0])]
+            self.player_messages[1] = ['T0.'] + pending[1] + ['P1', 'H' + CCARDS(round_state.hands[1])]
+            if self.record is not None:
+                self.record['hands'] = [list(map(str, hand)) for hand in round_state.hands]
         elif round_state.street > 0 and round_state.button == 1:
             board = round_state.deck[0]
             self.log.append(STREET_NAMES[round_state.street - 3] + ' ' + PCARDS(board) +
@@ -357,6 +2046,9 @@ class Game():
                 self.log.append("{}'s hand: {}".format(players[1].name, PCARDS(round_state.hands[1])))
                 self.player_messages[0].append('U' + CCARDS(round_state.hands[0]))
                 self.player_messages[1].append('U' + CCARDS(round_state.hands[1]))
+            if self.record is not None:
+                self.record['streets'].append({'street': round_state.street, 'board': list(map(str, board)),
+                                               'hands': [list(map(str, hand)) for hand in round_state.hands]})
 
     def log_action(self, name, action, bet_override):
         '''
@@ -378,6 +2070,14 @@ class Game():
         self.player_messages[0].append(code)
         self.player_messages[1].append(code)
 
+    def record_action(self, active, street, action, latency):
+        '''
+        Incorporates action information into the structured round record.
+        '''
+        amount = action.amount if isinstance(action, RaiseAction) else None
+        latency = None if latency is None else round(latency, 6)
+        self.record['actions'].append([active, street, ENCODE[type(action)], amount, latency])
+
     def log_terminal_state(self, players, round_state):
         '''
         Incorporates TerminalState information into the game log and player messages.
@@ -392,62 +2092,333 @@ class Game():
         self.log.append('{} awarded {}'.format(players[1].name, round_state.deltas[1]))
         self.player_messages[0].append('D' + str(round_state.deltas[0]))
         self.player_messages[1].append('D' + str(round_state.deltas[1]))
+        if self.record is not None:
+            self.record['showdown'] = FoldAction not in previous_state.legal_actions()
+            self.record['deltas'] = round_state.deltas
+
+    @staticmethod
+    def log_latency(players, elapsed, concurrent=False):
+        '''
+        Reports each player's latency percentiles by street and action type, and the engine's own time,
+        or how long each pokerbot was busy when it played several tables at once.
+        '''
+        latency = {}
+        print('Latency in seconds by street and action')
+        for player in players:
+            latency[player.name] = {}
+            for (street, code), histogram in sorted(player.latencies.items(),
+                                                    key=lambda item: (str(item[0][0]), item[0][1])):
+                summary = histogram.summary()
+                latency[player.name]['{} {}'.format(street, code)] = summary
+                print('{} {:>3} {}: {:>7} queries, p50 {:.6f}, p95 {:.6f}, p99 {:.6f}, max {:.6f}'.format(
+                    player.name, street, code, summary['count'], summary['p50'], summary['p95'],
+                    summary['p99'], summary['max']))
+        io_time = sum(player.io_time for player in players)
+        if concurrent:
+            # pokerbots think at the same time at different tables, so their time does not add up to the match's
+            print('Match took {:.3f}s, including {:.3f}s writing to sockets'.format(elapsed, io_time) +
+                  ''.join(PVALUE(player.name, '{:.3f}s busy'.format(player.wait_time)) for player in players))
+            busy = {player.name: player.wait_time for player in players}
+            result = {'latency': latency, 'engine': {'elapsed': elapsed, 'io': io_time, 'busy': busy}}
+        else:
+            engine_time = elapsed - sum(player.wait_time for player in players)
+            print('Engine {:.3f}s of {:.3f}s, including {:.3f}s writing to sockets'.format(engine_time, elapsed,
+                                                                                          io_time))
+            result = {'latency': latency, 'engine': {'elapsed': elapsed, 'engine': engine_time, 'io': io_time}}
+        return result
+
+    @staticmethod
+    def log_clock(players):
+        '''
+        Reports how much CPU and wall-clock time each pokerbot used, and how much the cpu game clock charged it.
+        '''
+        clock = {}
+        for player in players:
+            print('{} used {:.3f}s of CPU and waited {:.3f}s for one in {:.3f}s of wall-clock time, '
+                  'and was charged {:.3f}s'.format(player.name, player.cpu_used, player.queued_time,
+                                                   player.wall_time, player.charged_time))
+            clock[player.name] = {'cpu': player.cpu_used, 'queued': player.queued_time, 'wall': player.wall_time,
+                                  'charged': player.charged_time}
+        return clock
+
+    @staticmethod
+    def log_telemetry(players):
+        '''
+        Reports what each pokerbot's process consumed during the match.
+        '''
+        telemetry = {}
+        for player in players:
+            if player.telemetry is None:
+                continue
+            player.telemetry.sample()
+            summary = player.telemetry.summary()
+            telemetry[player.name] = summary
+            print('{} peak RSS {:.1f} MB, {:.3f}s CPU, at most {} threads over {} samples'.format(
+                player.name, summary['peak_rss_mb'], summary['cpu'], summary['max_threads'], summary['samples']))
+        return telemetry
+
+    def log_duplicate(self, players, first_player):
+        '''
+        Reports the mean and spread of the paired differences over all duplicate deals.
+        '''
+        summary = ''
+        for player in players:
+            # adding zero turns -0.0 into 0.0
+            mean = (self.duplicate.mean if player is first_player else -self.duplicate.mean) + 0.
+            summary += PVALUE(player.name, '{:.2f} per deal, stdev {:.2f}'.format(mean, self.duplicate.stdev()))
+        self.log.append('Duplicate over {} deals'.format(self.duplicate.count) + summary)
+        print('Duplicate over {} deals'.format(self.duplicate.count) + summary)
+
+    def log_sprt(self, players, first_player, round_num):
+        '''
+        Reports the sequential test's decision, or that it remained undecided.
+        '''
+        if self.sprt.decision is None:
+            outcome = 'undecided'
+        elif self.sprt.decision == 0:
+            outcome = 'no significant difference'
+        else:
+            better = first_player if self.sprt.decision == 1 else next(p for p in players if p is not first_player)
+            outcome = better.name + ' better'
+        self.log.append('SPRT after {} rounds: {}'.format(round_num, outcome))
+        print('SPRT after {} rounds: {}'.format(round_num, outcome))
+        return {'rounds': round_num, 'decision': outcome, 'mean': self.sprt.stats.mean,
+                'stdev': self.sprt.stats.stdev()}
+
+    def write_record(self, record):
+        '''
+        Appends one compact JSON record to the structured log.
+        '''
+        self.records.write(json.dumps(record, separators=(',', ':')) + '\n')
 
-    def run_round(self, players):
+    def run_round(self, players, deal_num):
         '''
         Runs one round of poker.
         '''
-        deck = eval7.Deck()
-        deck.shuffle()
-        deck = ([], deck)
-        hands = [deck[1].deal(2), deck[1].deal(2)]
-        pips = [SMALL_BLIND, BIG_BLIND]
-        stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
-        round_state = RoundState(0, 0, pips, stacks, hands, deck, None)
+        round_state = deal_round(self.seed, deal_num)
+        if self.records is not None:
+            self.record = {'players': [player.name for player in players], 'hands': None, 'streets': [], 'actions': []}
+        adjusted_deltas = None
         while not isinstance(round_state, TerminalState):
             self.log_round_state(players, round_state)
             active = round_state.button % 2
             player = players[active]
-            action = player.query(round_state, self.player_messages[active], self.log)
-            bet_override = (round_state.pips == [0, 0])
+            # once a player is all-in nobody has a decision left, so the history waits for the next message
+            forced = AUTO_ADVANCE and round_state.legal_actions() == {CheckAction}
+            if forced:
+                action = CheckAction()
+            else:
+                action = player.query(round_state, self.player_messages[active], self.log)
+            bet_override = (round_state.pips == (0, 0))
             self.log_action(player.name, action, bet_override)
+            if self.record is not None:
+                self.record_action(active, round_state.street, action, None if forced else player.latency)
+            committed_state = round_state
             round_state = round_state.proceed(action)
+            # an all-in closes the betting with cards still to come, so the rest of the round is pure luck
+            if (ALL_IN_EQUITY and adjusted_deltas is None and isinstance(round_state, RoundState)
+                    and round_state.street > committed_state.street and round_state.legal_actions() == {CheckAction}):
+                adjusted_deltas = all_in_deltas(committed_state, round_state.stacks,
+                                                round_rng(self.seed, '{}:equity'.format(deal_num)))
+                if self.record is not None:
+                    self.record['adjusted_deltas'] = [round(delta, 3) for delta in adjusted_deltas]
         self.log_terminal_state(players, round_state)
-        for player, player_message, delta in zip(players, self.player_messages, round_state.deltas):
-            player.query(round_state, player_message, self.log)
+        if adjusted_deltas is None:
+            adjusted_deltas = round_state.deltas
+        for player, player_message, delta, adjusted_delta in zip(players, self.player_messages,
+                                                                 round_state.deltas, adjusted_deltas):
+            if not SKIP_ROUND_ACKS:
+                player.query(round_state, player_message, self.log)
             player.bankroll += delta
+            player.adjusted_bankroll += adjusted_delta
 
-    def run(self):
+    def replay(self, players, deals):
         '''
-        Runs one game of poker.
+        Starts replaying the deals with every player in the other seat from its first play of each deal,
+        resetting the pokerbots which accept matches so that they have not seen the deals they replay.
         '''
-        print('   __  _____________  ___       __           __        __    ')
-        print('  /  |/  /  _/_  __/ / _ \\___  / /_____ ____/ /  ___  / /____')
-        print(' / /|_/ // /  / /   / ___/ _ \\/  \'_/ -_) __/ _ \\/ _ \\/ __(_-<')
-        print('/_/  /_/___/ /_/   /_/   \\___/_/\\_\\\\__/_/ /_.__/\\___/\\__/___/')
-        print()
-        print('Starting the Pokerbots engine...')
-        players = [
-            Player(PLAYER_1_NAME, PLAYER_1_PATH),
-            Player(PLAYER_2_NAME, PLAYER_2_PATH)
-        ]
-        for player in players:
-            player.build()
-            player.run()
+        # seats alternate every round, so an even number of deals ends with the seats as the first deal began
+        if deals % 2 == 0:
+            players = players[::-1]
+            self.player_messages = self.player_messages[::-1]
+        for player, player_message in zip(players, self.player_messages):
+            if player.forget(player_message[1:]):
+                del player_message[1:]
+        self.log.append('')
+        self.log.append('Replaying {} deals with the seats reversed'.format(deals))
+        return players
+
+    def play(self, players):
+        '''
+        Plays the rounds of one table, swapping the players' seats every round.
+        In duplicate mode every deal is played once before any is replayed with the seats reversed.
+        '''
+        first_player = players[0]
+        deals = NUM_ROUNDS // 2 if DUPLICATE else 0
+        # the first player's winnings from the first play of each deal, which its replay is paired with
+        first_plays = []
         for round_num in range(1, NUM_ROUNDS + 1):
+            # an odd round left over in duplicate mode plays one more deal, which is never replayed
+            deal_num = round_num - deals if round_num > deals else round_num
+            if deals > 0 and round_num == deals + 1:
+                players = self.replay(players, deals)
             self.log.append('')
             self.log.append('Round #' + str(round_num) + STATUS(players))
-            self.run_round(players)
+            # winnings are measured on the equity-adjusted bankroll, which is the bankroll without ALL_IN_EQUITY
+            start_bankroll = first_player.adjusted_bankroll
+            self.run_round(players, deal_num)
+            self.log.flush()
+            winnings = first_player.adjusted_bankroll - start_bankroll
+            sample = None
+            if not DUPLICATE:
+                sample = winnings
+            elif round_num <= deals:
+                first_plays.append(winnings)
+            elif round_num <= 2 * deals:
+                sample = first_plays[deal_num - 1] + winnings
+                self.duplicate.add(sample)
+            if self.records is not None:
+                self.write_record({'round': round_num, 'deal': deal_num, **self.record})
             players = players[::-1]
+            self.player_messages = self.player_messages[::-1]
+            self.rounds = round_num
+            # the test sees one sample per round, or per replayed deal, and ends the match once decided
+            if self.sprt is not None and sample is not None and self.sprt.add(sample) is not None:
+                break
+        self.players = players
+        self.first_player = first_player
+
+    def finish(self):
+        '''
+        Logs the final bankrolls and statistics of one table and returns its final record.
+        '''
+        players = self.players
         self.log.append('')
         self.log.append('Final' + STATUS(players))
-        for player in players:
-            player.stop()
-        name = GAME_LOG_FILENAME + '.txt'
-        print('Writing', name)
-        with open(name, 'w') as log_file:
-            log_file.write('\n'.join(self.log))
+        final = {'final': {player.name: player.bankroll for player in players}, 'seed': self.seed}
+        if ALL_IN_EQUITY:
+            self.log.append('Equity-adjusted' + ADJUSTED_STATUS(players))
+            print('Equity-adjusted' + ADJUSTED_STATUS(players))
+            final['adjusted'] = {player.name: player.adjusted_bankroll for player in players}
+        if self.sprt is not None:
+            final['sprt'] = self.log_sprt(players, self.first_player, self.rounds)
+        if DUPLICATE:
+            self.log_duplicate(players, self.first_player)
+            final['duplicate'] = {'deals': self.duplicate.count, 'mean': self.duplicate.mean,
+                                  'stdev': self.duplicate.stdev()}
+        return final
+
+    def close(self):
+        '''
+        Closes the game log and structured log.
+        '''
+        self.log.close()
+        if self.records is not None:
+            self.records.close()
 
+    def run(self, players=None, keep_players=False):
+        '''
+        Runs one game of poker, or NUM_TABLES games at once when both pokerbots accept tables.
+        Players kept running by the previous match's kept_players are reused instead of started.
+        With keep_players, pokerbots which accept matches are left running in kept_players for the caller
+        to pass to the next match, which must eventually stop them.
+        '''
+        print('   __  _____________  ___       __           __        __    ')
+        print('  /  |/  /  _/_  __/ / _ \\___  / /_____ ____/ /  ___  / /____')
+        print(' / /|_/ // /  / /   / ___/ _ \\/  \'_/ -_) __/ _ \\/ _ \\/ __(_-<')
+        print('/_/  /_/___/ /_/   /_/   \\___/_/\\_\\\\__/_/ /_.__/\\___/\\__/___/')
+        print()
+        print('Starting the Pokerbots engine...')
+        if players is not None:
+            for player in players:
+                player.begin_match()
+        else:
+            player_class = LocalPlayer if IN_PROCESS else Player
+            players = [
+                player_class(PLAYER_1_NAME, PLAYER_1_PATH),
+                player_class(PLAYER_2_NAME, PLAYER_2_PATH)
+            ]
+            # both pokerbots build and start at once, so the match begins as soon as the slower one has connected
+            # a pokerbot playing itself is built once, since both builds take the lock on its directory
+            threads = [Thread(target=player.prepare) for player in players]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for player in players:
+                player.connect()
+        print('Seed', self.seed)
+        games = [self]
+        if NUM_TABLES > 1:
+            if all('tables' in player.features for player in players):
+                games += [Game(table, self.seed) for table in range(1, NUM_TABLES)]
+                for player in players:
+                    player.start_tables(NUM_TABLES)
+            else:
+                print('Playing one table, since not every pokerbot accepted tables')
+        seats = [players] if len(games) == 1 else [[Seat(player, game.table) for player in players] for game in games]
+        for game in games:
+            print('Writing', game.log.name)
+        start_time = time.perf_counter()
+        try:
+            # every other table plays on its own thread, while each pokerbot's responses are routed by table
+            threads = [Thread(target=game.play, args=(table_seats,)) for game, table_seats in zip(games[1:], seats[1:])]
+            for thread in threads:
+                thread.start()
+            self.play(seats[0])
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start_time
+            finals = []
+            for game in games:
+                if len(games) > 1:
+                    print('Table #{}'.format(game.table) + STATUS(game.players))
+                finals.append(game.finish())
+            if len(games) > 1:
+                for game in games:
+                    for seat in game.players:
+                        seat.player.bankroll += seat.bankroll
+                        seat.player.adjusted_bankroll += seat.adjusted_bankroll
+                        seat.player.io_time += seat.io_time
+                        for key, histogram in seat.latencies.items():
+                            seat.player.latencies.setdefault(key, LatencyHistogram()).merge(histogram)
+                print('Final' + STATUS(players))
+            if LATENCY_REPORT:
+                finals[0].update(self.log_latency(players, elapsed, len(games) > 1))
+            if GAME_CLOCK_MODE == 'cpu':
+                finals[0]['clock'] = self.log_clock(players)
+            if TELEMETRY:
+                finals[0]['telemetry'] = self.log_telemetry(players)
+            for game, final in zip(games, finals):
+                if game.records is not None:
+                    game.write_record(final)
+        finally:
+            for game in games:
+                game.close()
+        if keep_players and len(games) == 1 and all(player.accepts_matches() for player in self.players):
+            # the pokerbots wait for the next match, unless either of them fails to
+            kept = [player.end_match(player_message[1:])
+                    for player, player_message in zip(self.players, self.player_messages)]
+            if all(kept):
+                self.kept_players = players
+            else:
+                for player, player_kept in zip(self.players, kept):
+                    if player_kept:
+                        player.stop()
+        elif len(games) == 1:
+            for player, player_message in zip(self.players, self.player_messages):
+                player.stop(player_message[1:])
+        else:
+            # the last message delivers what every table has not sent yet
+            for player in players:
+                pending_clauses = []
+                for game in games:
+                    seat_index = [seat.player for seat in game.players].index(player)
+                    pending_clauses += ['I' + str(game.table)] + game.player_messages[seat_index][1:]
+                player.stop(pending_clauses)
+        # equity-adjusted bankrolls are the bankrolls themselves without ALL_IN_EQUITY
+        self.adjusted_bankrolls = {player.name: player.adjusted_bankroll for player in players}
+        return {player.name: player.bankroll for player in players}
 
 if __name__ == '__main__':
     Game().run()
@@ -0,0 +1,237 @@
+'''
+Keeps one Python pokerbot imported and constructed, and forks a copy of it for every match.
+The engine starts it in the pokerbot's directory with the pokerbot's interpreter when FORK_SERVER is set.
+'''
+import importlib.util
+import traceback
+import argparse
+import selectors
+import signal
+import socket
+import random
+import json
+import time
+import sys
+import os
+
+MAX_FDS = 8
+REQUEST_TIMEOUT = 10.
+
+
+class SeedRecorder():
+    '''
+    Records which global random generators the pokerbot seeds while it loads, wrapping random.seed at once
+    and numpy.random.seed as soon as the pokerbot imports NumPy.
+    '''
+
+    def __init__(self):
+        self.seeded = set()
+        self.originals = []
+
+    def __enter__(self):
+        self.wrap(random, 'a')
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.meta_path.remove(self)
+        for module, seed in self.originals:
+            module.seed = seed
+
+    def wrap(self, module, keyword):
+        '''
+        Replaces a module's seed function with one which records being given a seed.
+        '''
+        seed = module.seed
+
+        def recording_seed(*args, **kwargs):
+            # seeding without a value draws fresh entropy, as every fork does anyway
+            if (args[0] if args else kwargs.get(keyword)) is not None:
+                self.seeded.add(module.__name__)
+            return seed(*args, **kwargs)
+        module.seed = recording_seed
+        self.originals.append((module, seed))
+
+    def find_spec(self, fullname, path, target=None):
+        '''
+        Finds numpy.random with the other finders and wraps its seed once the module has run.
+        '''
+        if fullname != 'numpy.random':
+            return None
+        for finder in sys.meta_path:
+            if finder is not self and hasattr(finder, 'find_spec'):
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+        else:
+            return None
+        exec_module = spec.loader.exec_module
+
+        def exec_and_wrap(module):
+            exec_module(module)
+            self.wrap(module, 'seed')
+        spec.loader.exec_module = exec_and_wrap
+        return spec
+
+
+def load_pokerbot(script):
+    '''
+    Imports the pokerbot's script without running its main block and constructs its Player,
+    which loads whatever tables the pokerbot reads on startup.
+    Returns the module, the Player and the names of the random modules the pokerbot seeded.
+    '''
+    sys.path.insert(0, os.getcwd())
+    spec = importlib.util.spec_from_file_location('pokerbot', os.path.abspath(script))
+    module = importlib.util.module_from_spec(spec)
+    with SeedRecorder() as recorder:
+        spec.loader.exec_module(module)
+        pokerbot = module.Player()
+    return module, pokerbot, recorder.seeded
+
+
+def bind(socket_path):
+    '''
+    Listens on the control socket, unless another fork server for the same pokerbot already does.
+    '''
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server_socket.bind(socket_path)
+    except OSError:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            probe.close()
+            return None
+        except OSError:
+            # left behind by a fork server which did not exit cleanly
+            os.unlink(socket_path)
+            server_socket.bind(socket_path)
+    server_socket.listen()
+    return server_socket
+
+
+def run_child(module, pokerbot, script, args, fds, seeded, random_state):
+    '''
+    Runs the forked pokerbot as if it had been started with args, writing its output to the engine's pipe.
+    '''
+    output_fd = fds[0]
+    os.dup2(output_fd, 1)
+    os.dup2(output_fd, 2)
+    os.close(output_fd)
+    # the engine names inherited sockets by their descriptors, which are numbered differently here
+    renumbered = {str(engine_fd): str(fd) for engine_fd, fd in zip(args['pass_fds'], fds[1:])}
+    sys.argv = [script] + [renumbered.get(arg, arg) for arg in args['args']]
+    # the child runs on the requesting engine's cores and at its priority, as a pokerbot it started itself would
+    if 'affinity' in args:
+        os.sched_setaffinity(0, args['affinity'])
+    try:
+        os.nice(args.get('nice', 0) - os.nice(0))
+    except OSError:
+        # raising a priority needs privileges which the fork server need not have
+        pass
+    # every child gets fresh seeds, as a newly started pokerbot would, except for the generators which
+    # the pokerbot seeded itself while loading; Python already reseeds random in forked children
+    if 'random' in seeded:
+        random.setstate(random_state)
+    if 'numpy.random' in sys.modules and 'numpy.random' not in seeded:
+        sys.modules['numpy.random'].seed()
+    code = 0
+    try:
+        module.run_bot(pokerbot, module.parse_args())
+    except BaseException:  # pylint: disable=broad-except
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)  # pylint: disable=protected-access
+
+
+def serve(server_socket, module, pokerbot, seeded, script, idle_timeout):
+    '''
+    Forks a pokerbot for every request and tells each requester when its pokerbot exits.
+    Exits once no pokerbot has run for idle_timeout seconds.
+    '''
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # terminating the server still removes its socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+    children = {}
+    random_state = random.getstate()
+    idle_since = time.monotonic()
+    while children or time.monotonic() - idle_since < idle_timeout:
+        for key, _ in selector.select(timeout=idle_timeout):
+            if key.fileobj is server_socket:
+                control, _ = server_socket.accept()
+                # an engine which dies before sending its request must not stall every other one
+                control.settimeout(REQUEST_TIMEOUT)
+                try:
+                    message, fds, _, _ = socket.recv_fds(control, 65536, MAX_FDS)
+                except OSError:
+                    fds = []
+                if len(fds) == 0:
+                    control.close()
+                    continue
+                control.settimeout(None)
+                sys.stdout.flush()
+                pid = os.fork()
+                if pid == 0:
+                    signal.set_wakeup_fd(-1)
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    selector.close()
+                    for connection in [server_socket, control] + list(children.values()):
+                        connection.close()
+                    os.close(wakeup_read)
+                    os.close(wakeup_write)
+                    run_child(module, pokerbot, script, json.loads(message.decode()), fds, seeded, random_state)
+                for fd in fds:
+                    os.close(fd)
+                control.sendall((json.dumps({'pid': pid}) + '\n').encode())
+                children[pid] = control
+            else:
+                os.read(wakeup_read, 4096)
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            control = children.pop(pid, None)
+            if control is not None:
+                try:
+                    control.sendall((json.dumps({'returncode': os.waitstatus_to_exitcode(status)}) + '\n').encode())
+                except OSError:
+                    pass
+                control.close()
+            if not children:
+                idle_since = time.monotonic()
+
+
+def main():
+    '''
+    Loads the pokerbot and serves forks of it.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 forkserver.py')
+    parser.add_argument('socket_path', type=str, help='Unix domain socket on which the engine requests forks')
+    parser.add_argument('script', type=str, help="The pokerbot's script, relative to its directory")
+    parser.add_argument('--idle-timeout', type=float, default=600.,
+                        help='Seconds without a running pokerbot before exiting, defaults to 600')
+    args = parser.parse_args()
+    # engines connect as soon as the socket is bound and wait for their forks while the pokerbot loads,
+    # however long its constructor takes
+    server_socket = bind(args.socket_path)
+    if server_socket is None:
+        return
+    try:
+        module, pokerbot, seeded = load_pokerbot(args.script)
+        serve(server_socket, module, pokerbot, seeded, args.script, args.idle_timeout)
+    finally:
+        server_socket.close()
+        os.unlink(args.socket_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,18 @@ class Bot():
         '''
         raise NotImplementedError('handle_round_over')
 
+    def handle_new_match(self):
+        '''
+        Called between matches when the engine keeps your bot running for the next one,
+        after the last round of a match and before the first round of the next.
+
+        Arguments:
+        Nothing.
+
+        Returns:
+        Nothing.
+        '''
+
     def get_action(self, game_state, round_state, active):
         '''
         Where the magic happens - your code should implement this function.
@@ -0,0 +1,172 @@
+'''
+The transports over which the pokerbot can talk to the engine.
+'''
+from multiprocessing import shared_memory, resource_tracker
+import socket
+import struct
+import time
+import os
+
+
+class RingFile():
+    '''
+    A file-like byte stream over a pair of single-producer, single-consumer rings in shared memory.
+    '''
+    HEADER = struct.Struct('<QQQ')  # bytes written, bytes read, closed flag
+    CAPACITY = 65536
+    SPINS = 1000
+
+    def __init__(self, shm, outgoing, timeout=None, alive=None, owner=False):
+        self.shm = shm
+        ring_size = self.HEADER.size + self.CAPACITY
+        rings = [shm.buf[0:ring_size], shm.buf[ring_size:2 * ring_size]]
+        self.outgoing = rings[outgoing]
+        self.incoming = rings[1 - outgoing]
+        self.buffer = bytearray()
+        self.timeout = timeout
+        self.alive = alive
+        self.owner = owner
+
+    def wait(self, spins, deadline):
+        '''
+        Spins briefly, then sleeps, while the other side catches up.
+        '''
+        if spins < self.SPINS:
+            os.sched_yield()
+        else:
+            time.sleep(0.0001)
+            if deadline is not None and time.perf_counter() > deadline:
+                raise socket.timeout
+            if self.alive is not None and not self.alive():
+                raise ConnectionError
+
+    def write(self, data):
+        '''
+        Copies bytes into the outgoing ring, waiting for space when it is full.
+        '''
+        view = memoryview(data)
+        spins = 0
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while len(view) > 0:
+            written, read, _ = self.HEADER.unpack_from(self.outgoing)
+            chunk = min(self.CAPACITY - (written - read), len(view))
+            if chunk == 0:
+                self.wait(spins, deadline)
+                spins += 1
+                continue
+            position = written % self.CAPACITY
+            first = min(chunk, self.CAPACITY - position)
+            start = self.HEADER.size + position
+            self.outgoing[start:start + first] = view[:first]
+            self.outgoing[self.HEADER.size:self.HEADER.size + chunk - first] = view[first:chunk]
+            struct.pack_into('<Q', self.outgoing, 0, written + chunk)
+            view = view[chunk:]
+        return len(data)
+
+    def fill(self):
+        '''
+        Moves every available byte from the incoming ring into the buffer, returning False at end of stream.
+        '''
+        spins = 0
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            written, read, closed = self.HEADER.unpack_from(self.incoming)
+            if written > read:
+                position = read % self.CAPACITY
+                first = min(written - read, self.CAPACITY - position)
+                start = self.HEADER.size + position
+                self.buffer += self.incoming[start:start + first]
+                self.buffer += self.incoming[self.HEADER.size:self.HEADER.size + written - read - first]
+                struct.pack_into('<Q', self.incoming, 8, written)
+                return True
+            if closed:
+                return False
+            try:
+                self.wait(spins, deadline)
+            except ConnectionError:
+                return False
+            spins += 1
+
+    def readline(self):
+        '''
+        Reads up to and including the next newline.
+        '''
+        while b'\n' not in self.buffer and self.fill():
+            pass
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return line
+
+    def read(self, size):
+        '''
+        Reads exactly size bytes, or fewer at end of stream.
+        '''
+        while len(self.buffer) < size and self.fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def flush(self):
+        '''
+        Writes are visible to the other side as soon as they are copied.
+        '''
+
+    def close(self):
+        '''
+        Marks the outgoing ring closed and releases the shared memory.
+        '''
+        if self.outgoing is not None:
+            struct.pack_into('<Q', self.outgoing, 16, 1)
+            self.outgoing.release()
+            self.incoming.release()
+            self.outgoing = self.incoming = None
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+
+
+def attach(name):
+    '''
+    Attaches to the engine's shared memory without letting this process unlink it on exit.
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # python < 3.13 always tracks shared memory
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')  # pylint: disable=protected-access
+        return shm
+
+
+def process_exists(pid):
+    '''
+    Returns whether a process is still running.
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def connect(args):
+    '''
+    Connects to the engine over the transport chosen by the engine, returning a file for the connection.
+    '''
+    if args.shm is not None:
+        if args.engine_pid is not None:
+            return RingFile(attach(args.shm), 1, alive=lambda: process_exists(args.engine_pid))
+        engine_pid = os.getppid()
+        return RingFile(attach(args.shm), 1, alive=lambda: os.getppid() == engine_pid)
+    if args.fd is not None:
+        sock = socket.socket(fileno=args.fd)
+    elif args.unix is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(args.unix)
+    else:
+        sock = socket.create_connection((args.host, args.port))
+    with sock:
+        return sock.makefile('rwb')
@@ -2,11 +2,30 @@
 The infrastructure for interacting with the engine.
 '''
 import argparse
-import socket
+import sys
+import copy
 from .actions import FoldAction, CallAction, CheckAction, RaiseAction
 from .states import GameState, TerminalState, RoundState
 from .states import STARTING_STACK, BIG_BLIND, SMALL_BLIND, FLOP_PERCENT, TURN_PERCENT
 from .bot import Bot
+from .transport import connect
+
+# protocol features this runner accepts when the engine offers them
+FEATURES = ['tables', 'matches']
+
+
+def parse_text(clause):
+    '''
+    Splits a text clause into its code and parsed value.
+    '''
+    code, value = clause[0], clause[1:]
+    if code == 'T':
+        return code, float(value)
+    if code in 'IPRD':
+        return code, int(value)
+    if code in 'HUBOV':
+        return code, value.split(',') if value else []
+    return code, None
 
 
 class Runner():
@@ -17,20 +36,24 @@ class Runner():
     def __init__(self, pokerbot, socketfile):
         self.pokerbot = pokerbot
         self.socketfile = socketfile
+        # the game tree of the table being played, and those of the tables set aside
+        self.state = (pokerbot, GameState(0, 0., 1), None, 0, True)
+        self.tables = {}
+        self.table = None
 
     def receive(self):
         '''
         Generator for incoming messages from the engine.
         '''
         while True:
-            packet = self.socketfile.readline().strip().split(' ')
-            if not packet:
+            line = self.socketfile.readline()
+            if not line:
                 break
-            yield packet
+            yield [parse_text(clause) for clause in line.decode().strip().split(' ')]
 
-    def send(self, action):
+    def send(self, action, table=None):
         '''
-        Encodes an action and sends it to the engine.
+        Encodes an action and sends it to the engine, starting with its table when playing several.
         '''
         if isinstance(action, FoldAction):
             code = 'F'
@@ -39,76 +62,121 @@ class Runner():
         elif isinstance(action, CheckAction):
             code = 'K'
         else:  # isinstance(action, RaiseAction)
-            code = 'R' + str(action.amount)
-        self.socketfile.write(code + '\n')
+            code = 'R'
+        prefix = 'I{} '.format(table) if table is not None else ''
+        self.socketfile.write((prefix + code + (str(action.amount) if code == 'R' else '') + '\n').encode())
+        self.socketfile.flush()
+
+    def accept_features(self, offered):
+        '''
+        Accepts the protocol features offered by the engine which this runner supports.
+        '''
+        accepted = [feature for feature in offered if feature in FEATURES]
+        self.socketfile.write(('V' + ','.join(accepted) + '\n').encode())
         self.socketfile.flush()
 
     def run(self):
         '''
-        Reconstructs the game tree based on the action history received from the engine.
+        Handles messages from the engine until the game is over.
         '''
-        game_state = GameState(0, 0., 1)
-        round_state = None
-        active = 0
-        round_flag = True
         for packet in self.receive():
-            for clause in packet:
-                if clause[0] == 'T':
-                    game_state = GameState(game_state.bankroll, float(clause[1:]), game_state.round_num)
-                elif clause[0] == 'P':
-                    active = int(clause[1:])
-                elif clause[0] == 'H':
-                    hands = [[], []]
-                    hands[active] = clause[1:].split(',')
-                    pips = [SMALL_BLIND, BIG_BLIND]
-                    stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
-                    round_state = RoundState(0, 0, pips, stacks, hands, [], None)
-                    if round_flag:
-                        self.pokerbot.handle_new_round(game_state, round_state, active)
-                        round_flag = False
-                elif clause[0] == 'U':
-                    hands = [[], []]
-                    hands[active] = clause[1:].split(',')
-                    round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
-                                             hands, round_state.deck, round_state.previous_state)
-                elif clause[0] == 'F':
-                    round_state = round_state.proceed(FoldAction())
-                elif clause[0] == 'C':
-                    round_state = round_state.proceed(CallAction())
-                elif clause[0] == 'K':
-                    round_state = round_state.proceed(CheckAction())
-                elif clause[0] == 'R':
-                    round_state = round_state.proceed(RaiseAction(int(clause[1:])))
-                elif clause[0] == 'B':
-                    round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
-                                             round_state.hands, clause[1:].split(','), round_state.previous_state)
-                elif clause[0] == 'O':
-                    # backtrack
-                    round_state = round_state.previous_state
-                    revised_hands = list(round_state.hands)
-                    revised_hands[1-active] = clause[1:].split(',')
-                    # rebuild history
-                    round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
-                                             revised_hands, round_state.deck, round_state.previous_state)
-                    round_state = TerminalState([0, 0], round_state)
-                elif clause[0] == 'D':
-                    assert isinstance(round_state, TerminalState)
-                    delta = int(clause[1:])
-                    deltas = [-delta, -delta]
-                    deltas[active] = delta
-                    round_state = TerminalState(deltas, round_state.previous_state)
-                    game_state = GameState(game_state.bankroll + delta, game_state.game_clock, game_state.round_num)
-                    self.pokerbot.handle_round_over(game_state, round_state, active)
-                    game_state = GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
-                    round_flag = True
-                elif clause[0] == 'Q':
-                    return
-            if round_flag:  # ack the engine
-                self.send(CheckAction())
-            else:
-                assert active == round_state.button % 2
-                action = self.pokerbot.get_action(game_state, round_state, active)
-                self.send(action)
+            if not self.handle(packet):
+                return
+
+    def handle(self, packet):
+        '''
+        Reconstructs the game tree based on one message of action history from the engine, and answers it.
+        With tables, every table has its own game tree and its own copy of the pokerbot.
+        Returns False once the game is over.
+        '''
+        pokerbot, game_state, round_state, active, round_flag = self.state
+        tables = self.tables
+        table = self.table
+        negotiated = False
+        for code, value in packet:
+            if code == 'I':
+                if table is not None:
+                    tables[table] = (pokerbot, game_state, round_state, active, round_flag)
+                table = value
+                if table not in tables:
+                    tables[table] = (copy.deepcopy(self.pokerbot), GameState(0, 0., 1), None, 0, True)
+                pokerbot, game_state, round_state, active, round_flag = tables[table]
+            elif code == 'T':
+                game_state = GameState(game_state.bankroll, value, game_state.round_num)
+            elif code == 'P':
+                active = value
+            elif code == 'H':
+                hands = [[], []]
+                hands[active] = value
+                pips = [SMALL_BLIND, BIG_BLIND]
+                stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
+                round_state = RoundState(0, 0, pips, stacks, hands, [], None)
+                if round_flag:
+                    pokerbot.handle_new_round(game_state, round_state, active)
+                    round_flag = False
+            elif code == 'U':
+                hands = [[], []]
+                hands[active] = value
+                round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                         hands, round_state.deck, round_state.previous_state)
+            elif code == 'F':
+                round_state = round_state.proceed(FoldAction())
+            elif code == 'C':
+                round_state = round_state.proceed(CallAction())
+            elif code == 'K':
+                round_state = round_state.proceed(CheckAction())
+            elif code == 'R':
+                round_state = round_state.proceed(RaiseAction(value))
+            elif code == 'B':
+                round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                         round_state.hands, value, round_state.previous_state)
+            elif code == 'O':
+                # backtrack
+                round_state = round_state.previous_state
+                revised_hands = list(round_state.hands)
+                revised_hands[1-active] = value
+                # rebuild history
+                round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                         revised_hands, round_state.deck, round_state.previous_state)
+                round_state = TerminalState([0, 0], round_state)
+            elif code == 'D':
+                assert isinstance(round_state, TerminalState)
+                delta = value
+                deltas = [-delta, -delta]
+                deltas[active] = delta
+                round_state = TerminalState(deltas, round_state.previous_state)
+                game_state = GameState(game_state.bankroll + delta, game_state.game_clock, game_state.round_num)
+                pokerbot.handle_round_over(game_state, round_state, active)
+                game_state = GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
+                round_flag = True
+            elif code == 'N':
+                # another match follows, so start over without the previous match's tables
+                pokerbot = self.pokerbot
+                game_state = GameState(0, 0., 1)
+                round_state = None
+                round_flag = True
+                tables = {}
+                table = None
+                pokerbot.handle_new_match()
+                # the engine saves this match's log once it has the ack
+                sys.stdout.flush()
+            elif code == 'V':
+                self.accept_features(value)
+                negotiated = True
+            elif code == 'Q':
+                return False
+        self.state = (pokerbot, game_state, round_state, active, round_flag)
+        self.tables = tables
+        self.table = table
+        if negotiated:  # the feature reply answers the engine
+            return True
+        if round_flag:  # ack the engine
+            self.send(CheckAction(), table)
+        else:
+            assert active == round_state.button % 2
+            action = pokerbot.get_action(game_state, round_state, active)
+            self.send(action, table)
+        return True
 
 
 def parse_args():
@@ -117,7 +185,12 @@ def parse_args():
     '''
     parser = argparse.ArgumentParser(prog='python3 player.py')
     parser.add_argument('--host', type=str, default='localhost', help='Host to connect to, defaults to localhost')
-    parser.add_argument('port', type=int, help='Port on host to connect to')
+    parser.add_argument('port', type=int, nargs='?', help='Port on host to connect to')
+    parser.add_argument('--unix', type=str, default=None, help='Unix domain socket to connect to instead of a port')
+    parser.add_argument('--fd', type=int, default=None, help='Inherited socket to use instead of a port')
+    parser.add_argument('--shm', type=str, default=None, help='Shared memory rings to use instead of a port')
+    parser.add_argument('--engine-pid', type=int, default=None,
+                        help='The engine process, which shared memory rings are used with, defaults to the parent')
     return parser.parse_args()
 
 def run_bot(pokerbot, args):
@@ -126,12 +199,10 @@ def run_bot(pokerbot, args):
     '''
     assert isinstance(pokerbot, Bot)
     try:
-        sock = socket.create_connection((args.host, args.port))
+        socketfile = connect(args)
     except OSError:
         print('Could not connect to {}:{}'.format(args.host, args.port))
         return
-    socketfile = sock.makefile('rw')
     runner = Runner(pokerbot, socketfile)
     runner.run()
     socketfile.close()
-    sock.close()
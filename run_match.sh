@@ -1,7 +1,3 @@
 #!/usr/bin/env bash
 
-for i in {1..10}
-do
-    python3 engine.py
-    grep "Final" ./gamelog.txt
-done
\ No newline at end of file
+python3 tournament.py --matches 10 "$@"
@@ -0,0 +1,177 @@
+'''
+Measures how many actions per second engine.RoundState advances, against the namedtuple RoundState it replaced.
+'''
+from collections import namedtuple
+import argparse
+import random
+import time
+import sys
+import os
+import eval7
+
+sys.path.append(os.getcwd())
+import engine
+from config import *
+
+
+def swap(player_card_index, hands, deck):
+    '''
+    Swaps player's card with a card from the deck.
+    '''
+    card_index = player_card_index % len(hands)
+    player_index = player_card_index // len(hands)
+    random_card = deck.deal(1)
+    deck.cards.append(hands[player_index][card_index])
+    hands[player_index][card_index] = random_card[0]
+    return hands, deck
+
+
+class NamedTupleRoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks', 'hands', 'deck',
+                                                      'previous_state'])):
+    '''
+    The namedtuple RoundState which engine.RoundState replaced, kept as the benchmark's baseline.
+    '''
+
+    def showdown(self):
+        '''
+        Compares the players' hands and computes payoffs.
+        '''
+        delta = engine.showdown_delta(self.deck[0], self.hands, self.stacks)
+        return engine.TerminalState([delta, -delta], self)
+
+    def legal_actions(self):
+        '''
+        Returns a set which corresponds to the active player's legal moves.
+        '''
+        active = self.button % 2
+        continue_cost = self.pips[1-active] - self.pips[active]
+        if continue_cost == 0:
+            bets_forbidden = (self.stacks[0] == 0 or self.stacks[1] == 0)
+            return {engine.CheckAction} if bets_forbidden else {engine.CheckAction, engine.RaiseAction}
+        raises_forbidden = (continue_cost == self.stacks[active] or self.stacks[1-active] == 0)
+        return ({engine.FoldAction, engine.CallAction} if raises_forbidden
+                else {engine.FoldAction, engine.CallAction, engine.RaiseAction})
+
+    def raise_bounds(self):
+        '''
+        Returns a tuple of the minimum and maximum legal raises.
+        '''
+        active = self.button % 2
+        continue_cost = self.pips[1-active] - self.pips[active]
+        max_contribution = min(self.stacks[active], self.stacks[1-active] + continue_cost)
+        min_contribution = min(max_contribution, continue_cost + max(continue_cost, BIG_BLIND))
+        return (self.pips[active] + min_contribution, self.pips[active] + max_contribution)
+
+    def proceed_street(self):
+        '''
+        Resets the players' pips and advances the game tree to the next round of betting.
+        '''
+        if self.street == 5:
+            return self.showdown()
+        new_street = 3 if self.street == 0 else self.street + 1
+        new_hands = [list(hand) for hand in self.hands]
+        new_deck = eval7.Deck()
+        new_deck.cards = self.deck[1].cards.copy()
+        if self.street == 0 or self.street == 3:
+            for i in range(sum([len(hand) for hand in self.hands])):
+                if self.deck[2].random() < (FLOP_PERCENT if self.street == 0 else TURN_PERCENT):
+                    new_hands, new_deck = swap(i, new_hands, new_deck)
+        board = self.deck[0] + new_deck.deal(3 if self.street == 0 else 1)
+        return NamedTupleRoundState(1, new_street, [0, 0], self.stacks, new_hands, (board, new_deck, self.deck[2]),
+                                    self)
+
+    def proceed(self, action):
+        '''
+        Advances the game tree by one action performed by the active player.
+        '''
+        active = self.button % 2
+        if isinstance(action, engine.FoldAction):
+            delta = self.stacks[0] - STARTING_STACK if active == 0 else STARTING_STACK - self.stacks[1]
+            return engine.TerminalState([delta, -delta], self)
+        if isinstance(action, engine.CallAction):
+            if self.button == 0:  # sb calls bb
+                return NamedTupleRoundState(1, 0, [BIG_BLIND] * 2, [STARTING_STACK - BIG_BLIND] * 2, self.hands,
+                                            self.deck, self)
+            new_pips = list(self.pips)
+            new_stacks = list(self.stacks)
+            contribution = new_pips[1-active] - new_pips[active]
+            new_stacks[active] -= contribution
+            new_pips[active] += contribution
+            state = NamedTupleRoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck,
+                                         self)
+            return state.proceed_street()
+        if isinstance(action, engine.CheckAction):
+            if (self.street == 0 and self.button > 0) or self.button > 1:
+                return self.proceed_street()
+            return NamedTupleRoundState(self.button + 1, self.street, self.pips, self.stacks, self.hands, self.deck,
+                                        self)
+        new_pips = list(self.pips)
+        new_stacks = list(self.stacks)
+        contribution = action.amount - new_pips[active]
+        new_stacks[active] -= contribution
+        new_pips[active] += contribution
+        return NamedTupleRoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self)
+
+
+def deal_namedtuple(seed, round_num):
+    '''
+    Deals one round into the baseline RoundState, shuffling exactly as engine.deal_round does.
+    '''
+    rng = engine.round_rng(seed, round_num)
+    deck = eval7.Deck()
+    rng.shuffle(deck.cards)
+    hands = [deck.deal(2), deck.deal(2)]
+    pips = [SMALL_BLIND, BIG_BLIND]
+    stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
+    return NamedTupleRoundState(0, 0, pips, stacks, hands, ([], deck, rng), None)
+
+
+ACTION_ORDER = [engine.FoldAction, engine.CallAction, engine.CheckAction, engine.RaiseAction]
+
+
+def play(deal, rounds, seed):
+    '''
+    Plays rounds of uniformly random legal actions and returns the number of actions and the first seat's winnings.
+    '''
+    chooser = random.Random(seed)
+    actions = 0
+    winnings = 0
+    for round_num in range(rounds):
+        round_state = deal(seed, round_num)
+        while not isinstance(round_state, engine.TerminalState):
+            legal_actions = round_state.legal_actions()
+            action = chooser.choice([action for action in ACTION_ORDER if action in legal_actions])
+            if action is engine.RaiseAction:
+                min_raise, max_raise = round_state.raise_bounds()
+                round_state = round_state.proceed(engine.RaiseAction(chooser.randint(min_raise, max_raise)))
+            else:
+                round_state = round_state.proceed(action())
+            actions += 1
+        winnings += round_state.deltas[0]
+    return actions, winnings
+
+
+def main():
+    '''
+    Benchmarks both representations on the same rounds and actions.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 state_benchmark.py')
+    parser.add_argument('--rounds', type=int, default=200000, help='Rounds to play, defaults to 200000')
+    parser.add_argument('--seed', type=str, default='benchmark', help='Seed for the deals and actions')
+    args = parser.parse_args()
+    results = {}
+    for name, deal in (('namedtuple', deal_namedtuple), ('engine', engine.deal_round)):
+        start_time = time.perf_counter()
+        actions, winnings = play(deal, args.rounds, args.seed)
+        elapsed = time.perf_counter() - start_time
+        results[name] = winnings
+        print('{:>10}: {} actions in {:.2f}s, {:.0f} actions per second'.format(name, actions, elapsed,
+                                                                               actions / elapsed))
+    # the same seed plays the same actions, so both representations must agree on every payoff
+    if results['namedtuple'] != results['engine']:
+        print('Results differ: {} and {}'.format(results['namedtuple'], results['engine']))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
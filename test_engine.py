@@ -0,0 +1,248 @@
+'''
+Regression tests for the engine, run with python3 -m pytest from the engine's directory.
+'''
+from contextlib import redirect_stdout
+import unittest
+import tempfile
+import shutil
+import random
+import io
+import os
+
+import engine
+
+ENGINE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+CRASHING_PLAYER = """'''
+Checks or calls for three rounds, then exits in the middle of the fourth.
+'''
+import sys
+from skeleton.actions import CallAction, CheckAction
+from skeleton.bot import Bot
+from skeleton.runner import parse_args, run_bot
+
+
+class Player(Bot):
+    '''
+    A pokerbot which crashes.
+    '''
+
+    def handle_new_round(self, game_state, round_state, active):
+        pass
+
+    def handle_round_over(self, game_state, terminal_state, active):
+        pass
+
+    def get_action(self, game_state, round_state, active):
+        if game_state.round_num > 3:
+            sys.exit()
+        return CheckAction() if CheckAction in round_state.legal_actions() else CallAction()
+
+
+if __name__ == '__main__':
+    run_bot(Player(), parse_args())
+"""
+
+
+class ConfiguredTest(unittest.TestCase):
+    '''
+    Restores every config.py value a test overrode.
+    '''
+
+    def setUp(self):
+        self.saved_config = {}
+
+    def tearDown(self):
+        for name, value in self.saved_config.items():
+            setattr(engine, name, value)
+
+    def configure(self, **config):
+        '''
+        Overrides config.py for this test only.
+        '''
+        for name, value in config.items():
+            self.saved_config.setdefault(name, getattr(engine, name))
+            setattr(engine, name, value)
+
+
+class SequentialTestTest(unittest.TestCase):
+    '''
+    The sequential test decides the sign of a mean once, and a side it rejected stays rejected.
+    '''
+
+    @staticmethod
+    def decide(sequential_test, samples):
+        '''
+        Adds samples until the test decides, returning its decision.
+        '''
+        for sample in samples:
+            decision = sequential_test.add(sample)
+            if decision is not None:
+                return decision
+        return None
+
+    def test_decisions(self):
+        for samples, decision in [([1.8, 2.2], 1), ([-1.8, -2.2], -1), ([0.1, -0.1], 0)]:
+            self.assertEqual(self.decide(engine.SequentialTest(1., 2), samples * 50), decision)
+
+    def test_decision_is_final(self):
+        sequential_test = engine.SequentialTest(1., 2)
+        self.assertEqual(self.decide(sequential_test, [1.8, 2.2] * 50), 1)
+        for _ in range(100):
+            self.assertEqual(sequential_test.add(-50.), 1)
+
+    def test_rejected_side_stays_rejected(self):
+        sequential_test = engine.SequentialTest(1., 2)
+        # the mean of delta was rejected by earlier samples
+        sequential_test.rejected[0] = True
+        self.assertEqual(self.decide(sequential_test, [2.9, 3.1] * 50), 0)
+        self.assertGreater(sequential_test.log_ratios()[0], sequential_test.upper)
+
+
+class OutputCaptureTest(ConfiguredTest):
+    '''
+    Player logs keep the head and/or tail of the output within PLAYER_LOG_SIZE_LIMIT and count what they dropped.
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp(prefix='pokerbots-test')
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def capture(self, keep, stream=False):
+        '''
+        Captures sixteen bytes in uneven chunks with a limit of ten and returns the saved log.
+        '''
+        self.configure(PLAYER_LOG_SIZE_LIMIT=10, PLAYER_LOG_KEEP=keep, PLAYER_LOG_STREAM=stream)
+        name = os.path.join(self.directory, keep + '.txt')
+        output = engine.OutputCapture(name)
+        for chunk in [b'0123', b'456789a', b'', b'b', b'cdef']:
+            output.put(chunk)
+        output.save()
+        with open(name, 'rb') as log_file:
+            return log_file.read()
+
+    def test_head(self):
+        self.assertEqual(self.capture('head'), b'0123456789\n[6 bytes dropped]\n')
+
+    def test_streamed_head(self):
+        self.assertEqual(self.capture('head', stream=True), b'0123456789\n[6 bytes dropped]\n')
+
+    def test_tail(self):
+        self.assertEqual(self.capture('tail'), b'[6 bytes dropped]\n6789abcdef')
+
+    def test_both(self):
+        self.assertEqual(self.capture('both'), b'01234\n[6 bytes dropped]\nbcdef')
+
+    def test_within_limit(self):
+        self.configure(PLAYER_LOG_SIZE_LIMIT=10, PLAYER_LOG_KEEP='both')
+        name = os.path.join(self.directory, 'short.txt')
+        output = engine.OutputCapture(name)
+        output.write('short')
+        output.save()
+        with open(name, 'rb') as log_file:
+            self.assertEqual(log_file.read(), b'short')
+
+
+class AllInEquityTest(ConfiguredTest):
+    '''
+    All-ins are credited with their expected payoffs, exactly whenever the runouts are few enough.
+    '''
+
+    @staticmethod
+    def all_in(street, hands, board):
+        '''
+        Returns a round where both players went all-in on street, with the rest of the deck undealt.
+        '''
+        deck = {str(card): card for card in engine.DECK_CARDS}
+        hands = [[deck.pop(name) for name in hand] for hand in hands]
+        board = [deck.pop(name) for name in board]
+        cards = hands[0] + hands[1] + board + list(deck.values())
+        stacks = (0, 0)
+        return engine.RoundState(0, street, stacks, stacks, hands, (board, cards, None, 4 + len(board)), None)
+
+    def test_flop_is_enumerated(self):
+        self.configure(FLOP_PERCENT=0., TURN_PERCENT=0., EQUITY_SAMPLES=1000)
+        round_state = self.all_in(3, [['Ah', 'Ac'], ['Kh', 'Kd']], ['2c', '7d', '9s'])
+        # kings win the 2 * 41 + 1 of the 990 runouts which bring a king and no ace
+        deltas = engine.all_in_deltas(round_state, round_state.stacks, None)
+        self.assertAlmostEqual(deltas[0], engine.STARTING_STACK * (990 - 2 * 83) / 990)
+        self.assertEqual(deltas[1], -deltas[0])
+
+    def test_swaps_are_sampled(self):
+        self.configure(FLOP_PERCENT=0., TURN_PERCENT=1., EQUITY_SAMPLES=1000)
+        round_state = self.all_in(3, [['Ah', 'Ac'], ['Kh', 'Kd']], ['2c', '7d', '9s'])
+        # every hole card is swapped on the turn, so neither pair survives
+        deltas = engine.all_in_deltas(round_state, round_state.stacks, random.Random(0))
+        self.assertLess(abs(deltas[0]), 30)
+
+    def test_preflop_is_sampled(self):
+        self.configure(FLOP_PERCENT=0., TURN_PERCENT=0., EQUITY_SAMPLES=20000)
+        round_state = self.all_in(0, [['Ah', 'Ac'], ['Kh', 'Kd']], [])
+        deltas = engine.all_in_deltas(round_state, round_state.stacks, random.Random(0))
+        self.assertAlmostEqual(deltas[0], 130, delta=8)
+
+
+class CrashedPlayerTest(ConfiguredTest):
+    '''
+    A pokerbot which crashes early in a long match must not slow the rest of the match down.
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp(prefix='pokerbots-test')
+        crasher = os.path.join(self.directory, 'crasher')
+        shutil.copytree(os.path.join(ENGINE_DIRECTORY, 'check_call'), crasher,
+                        ignore=shutil.ignore_patterns('__pycache__', engine.BUILD_CACHE_FILENAME))
+        with open(os.path.join(crasher, 'player.py'), 'w') as player_file:
+            player_file.write(CRASHING_PLAYER)
+        self.configure(PLAYER_1_PATH=crasher, PLAYER_2_PATH=os.path.join(ENGINE_DIRECTORY, 'check_call'),
+                       NUM_ROUNDS=400, SEED='crash', TRANSPORT='socketpair')
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        super().tearDown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def play(self):
+        '''
+        Plays the match and returns the game.
+        '''
+        game = engine.Game()
+        with redirect_stdout(io.StringIO()):
+            game.run()
+        return game
+
+    def check_pending_clauses(self):
+        '''
+        Only the last round's clauses may be left for the crashed pokerbot, however many rounds followed its crash.
+        '''
+        game = self.play()
+        with open(engine.GAME_LOG_FILENAME + '.txt') as game_log:
+            self.assertIn('A disconnected', game_log.read())
+        for player_message in game.player_messages:
+            self.assertLess(len(player_message), 20)
+
+    def test_subprocess(self):
+        self.check_pending_clauses()
+
+    def test_subprocess_skipping_acks(self):
+        self.configure(SKIP_ROUND_ACKS=True)
+        self.check_pending_clauses()
+
+    def test_in_process(self):
+        self.configure(IN_PROCESS=True)
+        self.check_pending_clauses()
+
+    def test_in_process_skipping_acks(self):
+        self.configure(IN_PROCESS=True, SKIP_ROUND_ACKS=True)
+        self.check_pending_clauses()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+'''
+Runs many engine matches concurrently and summarizes the final bankrolls.
+'''
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+import multiprocessing
+import argparse
+import statistics
+import json
+import math
+import sys
+import os
+
+sys.path.append(os.getcwd())
+import engine
+
+# two-sided 95% confidence, normal approximation
+Z_95 = 1.96
+# the pokerbots which each worker's last match kept running, when they are reused
+KEPT_PLAYERS = []
+
+
+def isolate_worker(core_sets, niceness):
+    '''
+    Pins one worker, and so every engine and pokerbot it starts, to a core set of its own, and lowers its priority.
+    '''
+    if core_sets is not None:
+        os.sched_setaffinity(0, core_sets.get())
+    if niceness:
+        os.nice(niceness)
+
+
+def run_match(directory, overrides):
+    '''
+    Runs one match inside its own directory and returns the final bankrolls and equity-adjusted bankrolls.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    for name, value in overrides.items():
+        setattr(engine, name, value)
+    with open('engine.txt', 'w') as engine_file, redirect_stdout(engine_file):
+        game = engine.Game()
+        result = game.run(KEPT_PLAYERS.pop() if KEPT_PLAYERS else None, keep_players=engine.REUSE_PLAYERS)
+        if game.kept_players is not None:
+            KEPT_PLAYERS.append(game.kept_players)
+        return result, game.adjusted_bankrolls
+
+
+def summarize(results):
+    '''
+    Computes the mean, standard deviation and confidence interval of each player's final bankroll.
+    '''
+    summary = {}
+    for name in results[0]:
+        bankrolls = [result[name] for result in results]
+        mean = statistics.mean(bankrolls)
+        stdev = statistics.stdev(bankrolls) if len(bankrolls) > 1 else 0.
+        half_width = Z_95 * stdev / math.sqrt(len(bankrolls))
+        summary[name] = {'matches': len(bankrolls), 'mean': mean, 'stdev': stdev,
+                         'ci95': [mean - half_width, mean + half_width],
+                         'wins': sum(1 for bankroll in bankrolls if bankroll > 0)}
+    return summary
+
+
+def parse_args():
+    '''
+    Parses the tournament arguments.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 tournament.py')
+    parser.add_argument('--matches', type=int, default=10, help='Number of matches to play, defaults to 10')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of matches to run concurrently, defaults to the number of cores')
+    parser.add_argument('--output', type=str, default='tournament',
+                        help='Directory which receives one subdirectory per match, defaults to tournament')
+    parser.add_argument('--rounds', type=int, default=None, help='Overrides NUM_ROUNDS from config.py')
+    parser.add_argument('--seed', type=str, default=None,
+                        help='Master seed from which every match derives its SEED, defaults to random')
+    parser.add_argument('--reuse', action='store_true',
+                        help='Keeps pokerbots which accept matches running from one match to the next in each worker')
+    parser.add_argument('--cores-per-match', type=int, default=None,
+                        help='Pins each match, its engine and both pokerbots, to this many cores of its own, '
+                             'and runs no more matches at once than the available cores allow')
+    parser.add_argument('--nice', type=int, default=0, help='Niceness added to every match, defaults to 0')
+    parser.add_argument('--sprt', action='store_true',
+                        help='Stops scheduling matches once a sequential test decides the comparison, '
+                             'using SPRT_ALPHA and SPRT_BETA from config.py')
+    parser.add_argument('--sprt-delta', type=float, default=None,
+                        help='Smallest difference in chips per match the test detects, defaults to SPRT_DELTA per round')
+    parser.add_argument('--sprt-min-matches', type=int, default=5,
+                        help='Matches played before the test may decide, defaults to 5')
+    args = parser.parse_args()
+    if args.cores_per_match is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            parser.error('--cores-per-match needs CPU affinity, which this platform does not support')
+        if not 0 < args.cores_per_match <= len(os.sched_getaffinity(0)):
+            parser.error('--cores-per-match must be between 1 and the {} available cores'.format(
+                len(os.sched_getaffinity(0))))
+    return args
+
+
+def main():
+    '''
+    Runs the tournament.
+    '''
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    # matches run from their own directories, so player paths must not be relative
+    overrides = {'PLAYER_1_PATH': os.path.abspath(engine.PLAYER_1_PATH),
+                 'PLAYER_2_PATH': os.path.abspath(engine.PLAYER_2_PATH)}
+    if args.rounds is not None:
+        overrides['NUM_ROUNDS'] = args.rounds
+    if args.reuse:
+        overrides['REUSE_PLAYERS'] = True
+    sprt = None
+    if args.sprt:
+        rounds = overrides.get('NUM_ROUNDS', engine.NUM_ROUNDS)
+        sprt = engine.SequentialTest(args.sprt_delta or engine.SPRT_DELTA * rounds, args.sprt_min_matches)
+    core_sets = None
+    workers = args.workers
+    if args.cores_per_match is not None:
+        # every worker plays its matches on cores which no other worker uses
+        cores = sorted(os.sched_getaffinity(0))
+        workers = min(workers, len(cores) // args.cores_per_match)
+        core_sets = multiprocessing.Queue()
+        for worker in range(workers):
+            core_sets.put(cores[worker * args.cores_per_match:(worker + 1) * args.cores_per_match])
+        print('Running {} matches at a time, each on {} cores'.format(workers, args.cores_per_match))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=isolate_worker,
+                             initargs=(core_sets, args.nice)) as executor:
+        futures = {}
+        for match_num in range(1, args.matches + 1):
+            if args.seed is not None:
+                overrides = dict(overrides, SEED='{}/{}'.format(args.seed, match_num))
+            directory = os.path.join(output, 'match_{:04d}'.format(match_num))
+            futures[executor.submit(run_match, directory, overrides)] = match_num
+        for future in as_completed(futures):
+            result, adjusted = future.result()
+            results.append(result)
+            print('Match #{}'.format(futures[future]) + ''.join(engine.PVALUE(name, bankroll)
+                                                                 for name, bankroll in result.items()))
+            # matches which have not started yet are cancelled once the comparison is decided,
+            # and the results of those still running are discarded
+            # the test sees equity-adjusted bankrolls, which vary less than the bankrolls with ALL_IN_EQUITY
+            if sprt is not None and sprt.add(adjusted[engine.PLAYER_1_NAME]) is not None:
+                for pending in futures:
+                    pending.cancel()
+                break
+    summary = summarize(results)
+    for name, stats in summary.items():
+        print('{}: mean {:.1f}, stdev {:.1f}, 95% CI [{:.1f}, {:.1f}], won {} of {}'.format(
+            name, stats['mean'], stats['stdev'], stats['ci95'][0], stats['ci95'][1], stats['wins'], stats['matches']))
+    if sprt is not None:
+        outcome = {1: engine.PLAYER_1_NAME + ' better', -1: engine.PLAYER_2_NAME + ' better',
+                   0: 'no significant difference', None: 'undecided'}[sprt.decision]
+        print('SPRT after {} matches: {}'.format(len(results), outcome))
+        summary['sprt'] = {'matches': len(results), 'decision': outcome}
+    with open(os.path.join(output, 'summary.json'), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
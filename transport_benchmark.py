@@ -0,0 +1,80 @@
+'''
+Measures the round-trip latency of each engine transport against a minimal echoing pokerbot.
+'''
+import subprocess
+import argparse
+import time
+import sys
+import os
+
+sys.path.append(os.getcwd())
+import engine
+
+MESSAGE = b'T29.871 P0 HAs,Kd B7h,2c,9s UAs,Kd R4 C\n'
+WARMUP_TRIPS = 100
+
+
+def echo():
+    '''
+    Acks every message over the transport chosen by the engine until it sends Q.
+    '''
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python_skeleton'))
+    from skeleton.runner import parse_args  # pylint: disable=import-outside-toplevel
+    from skeleton.transport import connect  # pylint: disable=import-outside-toplevel
+    socketfile = connect(parse_args())
+    while True:
+        line = socketfile.readline()
+        if not line or line.startswith(b'Q'):
+            break
+        socketfile.write(b'K\n')
+        socketfile.flush()
+    socketfile.close()
+
+
+def measure(transport, trips):
+    '''
+    Returns the sorted round-trip latencies over one transport.
+    '''
+    with engine.LISTENERS[transport]() as listener:
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--echo'] + listener.args,
+                                pass_fds=listener.pass_fds)
+        socketfile = listener.accept(proc)
+    latencies = []
+    # socketpair and shm connect before the pokerbot has started, so warm up before timing
+    for trip in range(WARMUP_TRIPS + trips):
+        start_time = time.perf_counter()
+        socketfile.write(MESSAGE)
+        socketfile.flush()
+        socketfile.readline()
+        if trip >= WARMUP_TRIPS:
+            latencies.append(time.perf_counter() - start_time)
+    socketfile.write(b'Q\n')
+    socketfile.flush()
+    proc.wait()
+    socketfile.close()
+    return sorted(latencies)
+
+
+def main():
+    '''
+    Benchmarks every transport.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 transport_benchmark.py')
+    parser.add_argument('--trips', type=int, default=20000, help='Round trips per transport, defaults to 20000')
+    parser.add_argument('--transports', type=str, nargs='+', default=list(engine.LISTENERS),
+                        help='Transports to measure, defaults to all of them')
+    args = parser.parse_args()
+    print('Round-trip latency in microseconds over {} trips'.format(args.trips))
+    for transport in args.transports:
+        latencies = measure(transport, args.trips)
+        print('{:>10}: mean {:7.1f}, p50 {:7.1f}, p99 {:7.1f}, max {:8.1f}'.format(
+            transport, 1e6 * sum(latencies) / len(latencies), 1e6 * latencies[len(latencies) // 2],
+            1e6 * latencies[int(len(latencies) * .99)], 1e6 * latencies[-1]))
+
+
+if __name__ == '__main__':
+    if '--echo' in sys.argv:
+        sys.argv.remove('--echo')
+        echo()
+    else:
+        main()